@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import wave
+
+import batch
+import metrics
+import pipeline
+import series
+import server
+from input import Input
+from live import LiveDecoder, StreamDecoder, WaveReplay
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='morsecode', description='Decodes morse code from wave audio files.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_decode = commands.add_parser('decode', help='decode a single wave file')
+    parser_decode.add_argument('file', help='path to the wave file (any rate, 8 to 32 bit or float PCM)')
+    parser_decode.add_argument('--plot', action='store_true', help='display diagnostic plots in between the steps')
+    parser_decode.add_argument('--detector', choices=('fft', 'goertzel'), default='fft', help='tone detector')
+    parser_decode.add_argument('--denoise', action='store_true',
+                               help='band-pass filter the audio around the tone and mute its pauses before detection')
+    parser_decode.add_argument('--export', metavar='FILE',
+                               help="also write the extracted signals to a file (CSV if it ends with '.csv', binary "
+                                    "otherwise)")
+    parser_decode.add_argument('--classifier', choices=sorted(pipeline.CLASSIFIERS),
+                               help="classifier of the signals, 'timing' estimates the 1:3:7 timing instead of "
+                                    "clustering and 'adaptive' also follows changes of the speed")
+    parser_decode.add_argument('--channels', type=int, metavar='N',
+                               help='decode up to N stations keying different tones (uses the timing classifier '
+                                    'unless another one is chosen, only --classifier applies)')
+    parser_decode.add_argument('--stream', action='store_true',
+                               help='decode files of any length with constant memory and print the characters as they '
+                                    'are decoded (tracks the speed, only --detector and --denoise apply)')
+    parser_decode.add_argument('--metrics', action='store_true',
+                               help='log the wall time and throughput of every stage to the standard error')
+    parser_decode.add_argument('--prometheus', metavar='FILE',
+                               help='sum up the metrics of every stage in a file in the text format of Prometheus')
+    parser_decode.add_argument('--model', metavar='FILE',
+                               help='use a stored clustering model (stored after training if it does not exist yet)')
+    parser_decode.add_argument('--refine', type=float,
+                               help='refine the stored model if its fit gets worse than this multiple of the original')
+
+    parser_batch = commands.add_parser('batch',
+                                       help='decode many wave files in parallel and write one JSON line per file')
+    parser_batch.add_argument('patterns', nargs='+', metavar='PATTERN',
+                              help="glob pattern of wave files (recursive with '**')")
+    parser_batch.add_argument('--workers', type=int, help='number of worker processes (default: number of CPUs)')
+    parser_batch.add_argument('--detector', choices=('fft', 'goertzel'), default='fft', help='tone detector')
+    parser_batch.add_argument('--denoise', action='store_true', help='denoise the audio before the tone detection')
+    parser_batch.add_argument('--classifier', choices=sorted(pipeline.CLASSIFIERS), default='kmeans',
+                              help='classifier of the signals')
+    parser_batch.add_argument('--model', metavar='FILE', help='use a stored clustering model')
+
+    parser_listen = commands.add_parser('listen', help='decode live audio from the microphone (or a replayed file)')
+    parser_listen.add_argument('--replay', metavar='FILE', help='replay a wave file at real-time pace instead')
+    parser_listen.add_argument('--duration', type=float, help='stop after the given number of seconds')
+    parser_listen.add_argument('--wpm', type=int, default=12, help="expected speed as defined by 'words per minute'")
+    parser_listen.add_argument('--window', type=int, default=32,
+                               help='number of latest marks the speed is tracked over (0 keeps the expected speed)')
+
+    parser_serve = commands.add_parser('serve', help='run a decode service on a TCP or Unix socket')
+    parser_serve.add_argument('--host', default='127.0.0.1', help='address of the TCP socket')
+    parser_serve.add_argument('--port', type=int, default=7373, help='port of the TCP socket')
+    parser_serve.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead')
+    parser_serve.add_argument('--workers', type=int, help='number of worker threads that decode')
+    parser_serve.add_argument('--sessions', type=int, default=16, help='maximum number of concurrent sessions')
+    parser_serve.add_argument('--timeout', type=float, default=30.0, help='seconds after which idle sessions close')
+
+    parser_send = commands.add_parser('send', help='decode a wave file with a running decode service')
+    parser_send.add_argument('file', help='path to the wave file')
+    parser_send.add_argument('--host', default='127.0.0.1', help='address of the service')
+    parser_send.add_argument('--port', type=int, default=7373, help='port of the service')
+    parser_send.add_argument('--unix', metavar='PATH', help='connect to a Unix socket instead')
+    parser_send.add_argument('--pcm', action='store_true', help='stream the samples instead of uploading the file')
+    parser_send.add_argument('--wpm', type=int, default=12, help="expected speed as defined by 'words per minute'")
+
+    parser_convert = commands.add_parser('convert', help='convert extracted signals between CSV and binary files')
+    parser_convert.add_argument('source', help='path to a CSV or binary series file')
+    parser_convert.add_argument('target', help='path to the converted file')
+
+    args = parser.parse_args()
+
+    if getattr(args, 'metrics', False):
+        logger = logging.getLogger('metrics')
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.StreamHandler(sys.stderr))
+        metrics.register(metrics.LoggingSink(logger))
+    if getattr(args, 'prometheus', None):
+        metrics.register(metrics.PrometheusSink(args.prometheus))
+
+    if args.command == 'decode' and (args.stream or args.channels):
+        # Both modes decode differently and only support some of the options
+        if args.stream:
+            mode, supported = '--stream', ('--detector', '--denoise')
+        else:
+            mode, supported = '--channels', ('--classifier',)
+        used = {'--plot': args.plot, '--detector': args.detector != 'fft', '--denoise': args.denoise,
+                '--export': args.export is not None, '--classifier': args.classifier is not None,
+                '--channels': args.channels is not None, '--model': args.model is not None,
+                '--refine': args.refine is not None}
+        unsupported = [option for option, value in used.items()
+                       if value and option != mode and option not in supported]
+        if unsupported:
+            parser.error('%s cannot be combined with %s' % (mode, ', '.join(unsupported)))
+
+    if args.command == 'decode' and args.stream:
+        try:
+            for characters in pipeline.decode_stream(args.file, args.detector, args.denoise):
+                print(characters, end='', flush=True)
+        except (OSError, wave.Error) as error:
+            parser.error(str(error))
+        print()
+    elif args.command == 'decode' and args.channels:
+        try:
+            messages = pipeline.decode_channels(args.file, args.channels, args.classifier or 'timing')
+        except (OSError, wave.Error) as error:
+            parser.error(str(error))
+        for frequency, message in messages:
+            print("%7.1f Hz: %s" % (frequency, message))
+    elif args.command == 'decode':
+        try:
+            print(pipeline.decode(args.file, args.plot, args.detector, args.export, args.model, args.refine,
+                                  classifier=args.classifier or 'kmeans', denoise=args.denoise))
+        except (OSError, ValueError, wave.Error) as error:
+            parser.error(str(error))
+    elif args.command == 'batch':
+        if args.model is not None and not os.path.exists(args.model):
+            parser.error("the clustering model '%s' does not exist" % args.model)
+        failures = batch.run(args.patterns, args.workers, detector=args.detector, model=args.model,
+                             classifier=args.classifier, denoise=args.denoise)
+        sys.exit(1 if failures else 0)
+    elif args.command == 'listen':
+        if args.replay is None:
+            Input().record_microphone(args.duration, args.wpm, args.window)
+            print()
+        else:
+            stream = StreamDecoder(wpm=args.wpm, window=args.window)
+            live = LiveDecoder(WaveReplay(args.replay), stream)
+            live.run(args.duration, lambda characters: print(characters, end='', flush=True))
+            print()
+            print(live.stats())
+    elif args.command == 'serve':
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        logging.getLogger('server').addHandler(handler)
+        logging.getLogger('server').setLevel(logging.INFO)
+        service = server.Server(args.workers, args.sessions, timeout=args.timeout)
+        try:
+            asyncio.run(service.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'send':
+        try:
+            summary = asyncio.run(server.send(args.file, args.host, args.port, args.unix, args.pcm,
+                                              options={'wpm': args.wpm},
+                                              on_characters=lambda characters: print(characters, end='', flush=True)))
+        except (OSError, ValueError, wave.Error) as error:
+            parser.error(str(error))
+        print()
+        print(summary)
+    elif args.command == 'convert':
+        try:
+            print(series.convert(args.source, args.target))
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipeline
+from decoder import State
+
+
+def decode_file(filename: str, options: dict) -> dict:
+    """
+    Decodes a single file and summarizes the result.
+    :param filename: The path to the wave file
+    :param options: Further keyword arguments of pipeline.decode
+    :return: A JSON serializable result with the decoded text, timings and error counts
+    """
+    result = {'file': filename}
+    timings = dict()
+    start = time.perf_counter()
+
+    try:
+        # The progress output of the pipeline is discarded
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            message = pipeline.decode(filename, timings=timings, **options)
+        result['text'] = message
+        result['errors'] = {
+            'signal': message.count('(E!)'),
+            'character': message.count(State.ERROR.value),
+        }
+    except SystemExit:
+        result['error'] = 'The file could not be read'
+    except Exception as exception:
+        result['error'] = '%s: %s' % (type(exception).__name__, exception)
+
+    timings['total'] = time.perf_counter() - start
+    result['timings'] = {step: round(seconds, 6) for step, seconds in timings.items()}
+    return result
+
+
+def run(patterns: list, workers: int = None, output=sys.stdout, **options) -> int:
+    """
+    Decodes all files that match the given patterns in parallel and writes one JSON line per file as soon as the
+    file is done.
+    :param patterns: Glob patterns of wave files (recursive with '**')
+    :param workers: Number of worker processes, the number of CPUs if not set
+    :param output: A text stream that receives the results
+    :param options: Further keyword arguments of pipeline.decode
+    :return: Number of files that could not be decoded
+    """
+    filenames = sorted({name for pattern in patterns for name in glob.glob(pattern, recursive=True)})
+    failures = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(decode_file, filename, options) for filename in filenames]
+        for future in as_completed(futures):
+            result = future.result()
+            if 'error' in result:
+                failures += 1
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+
+    return failures
@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import pipeline
+from clustering import Clustering
+from decoder import Decoder, decode_labels
+from generator import ALPHABET, Generator
+from preprocessor import Preprocessor
+from segmenter import segment
+from stft import Stft, gate
+from timing import TimingClassifier
+from wavfile import WaveFile
+
+# Characters of the generated texts and the length of their morse code
+LETTERS = {character: len(code) for character, code in ALPHABET.items() if character.isascii() and
+           character.isalnum()}
+
+
+class Corpus:
+    """
+    A reproducible simulated recording of a random text.
+    """
+
+    def __init__(self, symbols: int, wpm: int, noise: float, deviation: float, seed: int):
+        """
+        Generates the text and simulates its signals.
+        :param symbols: Minimum number of DITs and DAHs of the text
+        :param wpm: Speed as defined by 'words per minute'
+        :param noise: The added noise to the signal in percent
+        :param deviation: The variance of the duration and loudness of a signal in percent
+        :param seed: Seed of the random number generators
+        """
+        self.wpm = wpm
+        self.text = self._text(symbols, random.Random(seed))
+
+        self._generator = Generator(noise, deviation, deviation, wpm, seed)
+        self._generator.simulate(self._generator.encode(self.text))
+        endtimes, loudness = self._generator.get_series()
+
+        # A final word pause completes the last character
+        self.endtimes = np.append(endtimes, endtimes[-1] + 7 * 1.2 / wpm)
+        self.loudness = np.append(loudness, noise / 100.0)
+
+    @staticmethod
+    def _text(symbols: int, rng: random.Random) -> str:
+        letters = sorted(LETTERS)
+        words = list()
+        count = 0
+        while count < symbols:
+            word = rng.choices(letters, k=rng.randint(2, 8))
+            count += sum(LETTERS[letter] for letter in word)
+            words.append(''.join(word))
+        return ' '.join(words)
+
+    def render(self, filename: str, rate: int = 8000, tone: float = 600.0) -> WaveFile:
+        """
+        Renders the signals as keyed sine tone with white noise into a wave file.
+        :param filename: The path to the wave file
+        :param rate: The sample rate
+        :param tone: The frequency of the tone in Hz
+        :return: The rendered wave file
+        """
+        self._generator.render(filename, tone, rate, noise=0.03)
+        return WaveFile(filename)
+
+
+def _measure(results: list, case: dict, stage: str, items: int, function, *args):
+    """
+    Runs a single stage and records its wall time, throughput and peak memory.
+    :return: The result of the stage
+    """
+    # Stages like the label mapping of the clustering print their progress, which must not mix into the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        # The first run pays for lazy imports and caches, which neither the time nor the memory should include
+        function(*args)
+
+        # Tracing the allocations slows the stage down, so its memory is measured in a run of its own
+        tracemalloc.start()
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+
+    results.append(dict(case, stage=stage, items=items, seconds=round(seconds, 6),
+                        throughput=round(items / seconds if seconds > 0 else 0.0, 1), peak_memory=peak))
+    return result
+
+
+def _accuracy(expected: str, actual: str, limit: int) -> float:
+    """
+    :return: Similarity of the first characters of both texts between 0 and 1
+    """
+    return difflib.SequenceMatcher(None, expected[:limit], actual.strip()[:limit], autojunk=False).ratio()
+
+
+def run(sizes: list, speeds: list, noises: list, deviations: list, seed: int = 1, audio: int = 10000,
+        limit: int = 20000) -> list:
+    """
+    Benchmarks every stage of the pipeline on its own for every combination of the given parameters.
+    :param sizes: Numbers of DITs and DAHs
+    :param speeds: Speeds as defined by 'words per minute'
+    :param noises: Added noise in percent
+    :param deviations: Variance of the duration and loudness of the signals in percent
+    :param seed: Seed of the random number generators
+    :param audio: Maximum number of symbols for which audio is rendered and analysed
+    :param limit: Number of characters that are compared for the accuracy
+    :return: A list of measurements
+    """
+    results = list()
+    logger = logging.getLogger('benchmark')
+
+    for symbols in sizes:
+        for wpm in speeds:
+            for noise in noises:
+                for deviation in deviations:
+                    case = dict(symbols=symbols, wpm=wpm, noise=noise, deviation=deviation, seed=seed)
+                    corpus = Corpus(symbols, wpm, noise, deviation, seed)
+
+                    if symbols <= audio:
+                        with tempfile.TemporaryDirectory() as directory:
+                            filename = os.path.join(directory, 'corpus.wav')
+                            waveform = _measure(results, case, 'synthesis', len(corpus.endtimes), corpus.render,
+                                                filename)
+                            samples = waveform.samples
+                            stft = Stft()
+                            maxima, minima = _measure(results, case, 'envelope', len(samples), stft.band_extrema,
+                                                      samples)
+                            fouriers, _ = gate(maxima, minima)
+                            _measure(results, case, 'segmentation', len(fouriers), segment, fouriers, 0.48)
+
+                            # The whole pipeline from the audio to the text, as 'decode' runs it
+                            message = _measure(results, case, 'audio', len(samples), pipeline.decode, filename)
+                            results[-1]['accuracy'] = round(_accuracy(corpus.text, message, limit), 4)
+
+                    def preprocess():
+                        preprocessor = Preprocessor()
+                        preprocessor.read_series(corpus.endtimes, corpus.loudness)
+                        preprocessor.process_loudness()
+                        return preprocessor.get_batch()
+
+                    def cluster(batch, classifier):
+                        return classifier.train(batch), classifier.get_label_mapping()
+
+                    def decode(signals):
+                        decoder = Decoder(logger)
+                        for signal in signals:
+                            decoder.decode(signal)
+                        return decoder.message
+
+                    n = len(corpus.endtimes)
+                    batch = _measure(results, case, 'preprocessing', n, preprocess)
+                    labels, mapping = _measure(results, case, 'clustering', n, cluster, batch, Clustering(5))
+                    _measure(results, case, 'timing', n, cluster, batch, TimingClassifier())
+                    signals = [mapping.get(label) for label in labels]
+                    message = _measure(results, case, 'decoder', n, decode, signals)
+                    results[-1]['accuracy'] = round(_accuracy(corpus.text, message, limit), 4)
+                    message = _measure(results, case, 'decode_labels', n, decode_labels, labels, mapping)
+                    results[-1]['accuracy'] = round(_accuracy(corpus.text, message, limit), 4)
+    return results
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Finds the stages that became slower than the baseline.
+    :param results: The current measurements
+    :param baseline: Measurements of an earlier run
+    :param tolerance: Allowed slowdown as a factor, e.g. 1.2 for 20%
+    :return: (measurement, baseline measurement) for every regression
+    """
+    key = ('stage', 'symbols', 'wpm', 'noise', 'deviation', 'seed')
+    earlier = {tuple(result[k] for k in key): result for result in baseline}
+    regressions = list()
+    for result in results:
+        previous = earlier.get(tuple(result[k] for k in key))
+        if previous is not None and result['seconds'] > tolerance * previous['seconds']:
+            regressions.append((result, previous))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the stages of the pipeline with simulated recordings.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='numbers of symbols')
+    parser.add_argument('--wpm', type=int, nargs='+', default=[12], help="speeds as 'words per minute'")
+    parser.add_argument('--noise', type=float, nargs='+', default=[18.0], help='added noise in percent')
+    parser.add_argument('--deviation', type=float, nargs='+', default=[10.0], help='variance in percent')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the random number generators')
+    parser.add_argument('--audio', type=int, default=10000, help='maximum number of symbols rendered as audio')
+    parser.add_argument('--save', metavar='JSON', help='store the measurements as baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare the measurements with a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='allowed slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    measurements = run(args.sizes, args.wpm, args.noise, args.deviation, args.seed, args.audio)
+
+    print()
+    print("%-14s %9s %4s %6s %6s %10s %14s %12s %9s" % ('stage', 'symbols', 'wpm', 'noise', 'dev', 'seconds',
+                                                      'items/s', 'peak (KiB)', 'accuracy'))
+    for m in measurements:
+        # Only the stages that decode a text have an accuracy
+        accuracy = '%9.4f' % m['accuracy'] if 'accuracy' in m else '%9s' % '-'
+        print("%-14s %9d %4d %6.1f %6.1f %10.4f %14.1f %12d %s" % (
+            m['stage'], m['symbols'], m['wpm'], m['noise'], m['deviation'], m['seconds'], m['throughput'],
+            m['peak_memory'] // 1024, accuracy))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(measurements, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            slower = compare(measurements, json.load(file), args.tolerance)
+        for current, earlier in slower:
+            print("Regression: %s with %d symbols took %.4fs instead of %.4fs" % (
+                current['stage'], current['symbols'], current['seconds'], earlier['seconds']))
+        sys.exit(1 if slower else 0)
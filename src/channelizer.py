@@ -0,0 +1,128 @@
+import numpy as np
+
+import metrics
+from decoder import decode_labels
+from preprocessor import Preprocessor
+from segmenter import segment
+from stft import Stft, gate
+from timing import TimingClassifier
+
+
+class Channelizer:
+    """
+    Decodes several stations keying different tones within the same recording. The spectrum is calculated only once,
+    every detected tone is then followed by its own chain of envelope, segmentation, classification and decoding.
+    """
+
+    def __init__(self, frame_size: int = 256, hop: int = None, rate: int = 8000, channels: int = 4,
+                 neighbours: int = 1, contrast: float = 4.0, dynamic: float = 0.05, tolerance: float = 0.48):
+        """
+        Configures the channelizer.
+        :param frame_size: Number of samples per analysed frame
+        :param hop: Number of samples between the starts of two frames (defaults to the frame size)
+        :param rate: The sample rate of the recording
+        :param channels: The maximum number of tones that are decoded
+        :param neighbours: Number of bins on each side of a tone bin that belong to its channel as well
+        :param contrast: Factor by which a tone has to stand out of the noise floor of the spectrum
+        :param dynamic: Fraction of the strongest tone a weaker tone needs to reach to be decoded as well
+        :param tolerance: Loudness area in which the signal is thought to be the same
+        """
+        # A Hann window keeps strong tones from leaking into the bins of their neighbours
+        self._stft = Stft(frame_size, hop, 'hann')
+        self.rate = rate
+        self.channels = channels
+        self.neighbours = neighbours
+        self.contrast = contrast
+        self.dynamic = dynamic
+        self.tolerance = tolerance
+
+    def spectrogram(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Calculates the relevant part of the spectrum of every complete frame, one block of frames at a time.
+        :param samples: A 1-D array of samples
+        :return: An array of the shape (frames, bins) with the magnitudes
+        """
+        frames = self._stft.frames(samples)
+        bins = round(Stft.UPPER_RATIO * self._stft.frame_size) - Stft.LOWER_BOUND
+        spectrogram = np.empty((len(frames), max(bins, 0)), dtype=np.float32)
+
+        for start in range(0, len(frames), self._stft.block):
+            spectrogram[start:start + self._stft.block] = self._stft.spectra(frames[start:start + self._stft.block])
+        return spectrogram
+
+    def detect(self, spectrogram: np.ndarray) -> np.ndarray:
+        """
+        Finds the bins of the keyed tones: bins that are loud during a part of the recording, much louder than the
+        typical bin and louder than their neighbours.
+        :param spectrogram: The magnitudes of every frame
+        :return: The indices of the tone bins within the spectrogram, strongest tone first
+        """
+        if len(spectrogram) == 0 or spectrogram.shape[1] < 3:
+            return np.empty(0, dtype=np.int64)
+
+        # A keyed tone is on for a good part of the time, so its upper percentile stands out
+        levels = np.percentile(spectrogram, 90, axis=0)
+        floor = np.median(levels)
+        peaks = np.flatnonzero((levels[1:-1] >= levels[:-2]) & (levels[1:-1] > levels[2:])) + 1
+        peaks = peaks[(levels[peaks] > self.contrast * floor) & (levels[peaks] >= self.dynamic * levels.max())]
+
+        tones = list()
+        for peak in peaks[np.argsort(-levels[peaks])]:
+            if all(abs(peak - tone) > 2 * self.neighbours for tone in tones):
+                tones.append(peak)
+            if len(tones) == self.channels:
+                break
+        return np.array(tones, dtype=np.int64)
+
+    def frequency(self, index: int) -> float:
+        """
+        :param index: The index of a bin within the spectrogram
+        :return: The center frequency of the bin in Hz
+        """
+        return float((Stft.LOWER_BOUND + index) * self.rate / self._stft.frame_size)
+
+    def envelopes(self, spectrogram: np.ndarray, tones: np.ndarray) -> np.ndarray:
+        """
+        Follows the loudness of every tone, gated like the single-tone input.
+        :param spectrogram: The magnitudes of every frame
+        :param tones: The indices of the tone bins
+        :return: An array of the shape (tones, frames) with the envelope of every tone
+        """
+        minima = spectrogram.min(axis=1)
+        envelopes = np.empty((len(tones), len(spectrogram)))
+        for channel, tone in enumerate(tones):
+            low, high = max(tone - self.neighbours, 0), tone + self.neighbours + 1
+            envelopes[channel], _ = gate(spectrogram[:, low:high].max(axis=1), minima)
+        return envelopes
+
+    def series(self, envelope: np.ndarray) -> tuple:
+        """
+        Splits an envelope into signals.
+        :param envelope: The envelope of a tone
+        :return: (endtimes, loudness) as arrays with the end time in seconds and the loudness of every signal
+        """
+        x, y = segment(envelope, self.tolerance)
+        return x * self._stft.hop / self.rate, y
+
+    def decode(self, samples: np.ndarray, classifier=TimingClassifier) -> list:
+        """
+        Decodes every tone within the given samples.
+        :param samples: A 1-D array of samples
+        :param classifier: Creates the classifier of the signals of a channel
+        :return: A list of (frequency, message) for every detected tone, strongest tone first
+        """
+        spectrogram = self.spectrogram(samples)
+        tones = self.detect(spectrogram)
+        metrics.annotate(frames=len(spectrogram), buffer=spectrogram.size,
+                         tones=[round(self.frequency(tone)) for tone in tones])
+
+        messages = list()
+        for tone, envelope in zip(tones, self.envelopes(spectrogram, tones)):
+            preprocessor = Preprocessor()
+            preprocessor.read_series(*self.series(envelope))
+            preprocessor.process_loudness()
+
+            channel = classifier()
+            labels = channel.train(preprocessor.get_batch())
+            messages.append((self.frequency(tone), decode_labels(labels, channel.get_label_mapping())))
+        return messages
@@ -1,7 +1,6 @@
-import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.cluster import KMeans
 
+import metrics
 from decoder import Signal
 
 
@@ -9,43 +8,105 @@ class Clustering:
     """
     A machine learning algorithm that uses unsupervised learning processes in order to determine clusters.
     """
-    _kmeans: KMeans
+    _kmeans: 'KMeans'
     _prediction: list
     _n_clusters: int = 0
 
-    def __init__(self, number_of_clusters: int):
+    # Cluster centers, mean squared distance of the training data to them and the label mapping
+    _centroids: np.ndarray = None
+    _reference: float = 0.0
+    _mapping: dict = None
+
+    def __init__(self, number_of_clusters: int, plot: bool = False):
         """
         Configures the algorithm
         :param number_of_clusters: The number of clusters for the algorithm to form.
+        :param plot: Should the formed clusters be displayed?
         """
         self._n_clusters = number_of_clusters
+        self._plot = plot
 
     def train(self, batch: list) -> list:
         """
         Forms the configured number of clusters out of the given batch.
-        :param batch: Training data in the form of a list of tuples.
+        :param batch: Training data in the form of an array of pairs or a list of tuples.
         :return: Returns a list of labels for each data point
         """
 
+        from sklearn.cluster import KMeans
+
         data = np.array(batch)
         n_samples = len(batch)
-        print("Samples: %d" % n_samples)
+        metrics.annotate(items=n_samples)
 
         self._kmeans = KMeans(n_clusters=self._n_clusters, init='k-means++', random_state=150).fit(data)
         self._prediction = self._kmeans.predict(data)
+        self._centroids = self._kmeans.cluster_centers_
+        self._reference = self._kmeans.inertia_ / n_samples
+        self._mapping = None
 
-        plt.figure(figsize=(12, 12))
-        plt.scatter(data[:, 0], data[:, 1], c=self._prediction)
-        plt.title("k-means++")
+        self._show(data)
+        return self._prediction
 
-        plt.show()
+    def classify(self, batch: list, refine: float = None) -> list:
+        """
+        Assigns the given batch to the clusters of a trained or loaded model without fitting it again.
+        :param batch: Data in the form of an array of pairs or a list of tuples.
+        :param refine: If the mean squared distance to the clusters exceeds this multiple of the one of the training
+                       data, the clusters are refined with the batch, starting from the current clusters.
+        :return: Returns a list of labels for each data point
+        """
+        data = np.array(batch)
+        metrics.annotate(items=len(data))
+        self._prediction, distances = self._predict(data)
+        quality = distances.mean() if len(distances) else 0.0
+
+        if refine is not None and quality > refine * self._reference and len(data) >= self._n_clusters:
+            from scipy.optimize import linear_sum_assignment
+            from sklearn.cluster import KMeans
+            print("Refining clusters (mean squared distance %f, reference %f)" % (quality, self._reference))
+            self._kmeans = KMeans(n_clusters=self._n_clusters, init=self._centroids, n_init=1).fit(data)
+
+            # The refined clusters are not necessarily in the order of the current ones, every refined cluster takes
+            # the place of the current one it moved away from the least, so that the label mapping still applies
+            centroids = self._kmeans.cluster_centers_
+            distances = ((self._centroids[:, np.newaxis, :] - centroids[np.newaxis, :, :]) ** 2).sum(axis=2)
+            _, order = linear_sum_assignment(distances)
+            self._centroids = centroids[order]
+            self._reference = self._kmeans.inertia_ / len(data)
+            self._prediction, _ = self._predict(data)
+
+        self._show(data)
         return self._prediction
 
+    def _predict(self, data: np.ndarray) -> tuple:
+        """
+        Assigns every data point to its nearest cluster center.
+        :param data: An array of data points
+        :return: (labels, squared distances) for every data point
+        """
+        data = data.reshape(-1, self._centroids.shape[1])
+        distances = ((data[:, np.newaxis, :] - self._centroids[np.newaxis, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        return labels, distances[np.arange(len(labels)), labels]
+
+    def _show(self, data: np.ndarray) -> None:
+
+        if self._plot:
+            import matplotlib.pyplot as plt
+            plt.figure(figsize=(12, 12))
+            plt.scatter(data[:, 0], data[:, 1], c=self._prediction)
+            plt.title("k-means++")
+            plt.show()
+
     def get_label_mapping(self) -> dict:
         """
         Matches the internal labels to pre-defined enums that contain semantics.
         :return: A mapping that contains a Signal for every internally used label.
         """
+        if self._mapping is not None:
+            return dict(self._mapping)
+
         mapping = dict()
         print()
 
@@ -67,10 +128,11 @@ class Clustering:
         # TODO : Plot test points
 
         print()
-        return mapping
+        self._mapping = mapping
+        return dict(mapping)
 
     def _map(self, _map: dict, tuples: list, signal: Signal) -> None:
-        prediction = self._kmeans.predict(np.array(tuples))
+        prediction, _ = self._predict(np.array(tuples))
 
         _sum = 0.0
         for label in prediction:
@@ -79,3 +141,32 @@ class Clustering:
 
         label = round(_sum / len(prediction))
         _map[label] = signal
+
+    def save(self, filename: str) -> None:
+        """
+        Stores the trained model, i.e. the cluster centers and the label mapping, in a compact file.
+        :param filename: The path to the file (a NumPy .npz archive)
+        """
+        mapping = self.get_label_mapping()
+        labels = sorted(mapping)
+        with open(filename, 'wb') as file:
+            np.savez(file, centroids=self._centroids, reference=self._reference, labels=np.array(labels),
+                     signals=np.array([mapping[label].value for label in labels]))
+
+    @classmethod
+    def load(cls, filename: str, plot: bool = False):
+        """
+        Loads a model that has been stored before.
+        :param filename: The path to the file
+        :param plot: Should the formed clusters be displayed?
+        :return: A clustering that can classify new batches right away
+        """
+        with np.load(filename) as archive:
+            if 'centroids' not in archive:
+                raise ValueError("'%s' is not a clustering model" % filename)
+            clustering = cls(len(archive['centroids']), plot)
+            clustering._centroids = archive['centroids']
+            clustering._reference = float(archive['reference'])
+            clustering._mapping = {int(label): Signal(int(signal))
+                                   for label, signal in zip(archive['labels'], archive['signals'])}
+        return clustering
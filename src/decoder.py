@@ -1,6 +1,10 @@
 import logging
 from enum import Enum, auto
 
+import numpy as np
+
+import metrics
+
 
 class Signal(Enum):
     """A single signal that has been processed by the machine learning algorithm"""
@@ -102,222 +106,237 @@ class State(Enum):
     """.-.-.-"""
 
 
-class Decoder:
+# Morse code of every state that can be reached by the decoder
+CODES = {
+    State.LETTER_A: '.-',
+    State.LETTER_B: '-...',
+    State.LETTER_C: '-.-.',
+    State.LETTER_D: '-..',
+    State.LETTER_E: '.',
+    State.LETTER_F: '..-.',
+    State.LETTER_G: '--.',
+    State.LETTER_H: '....',
+    State.LETTER_I: '..',
+    State.LETTER_J: '.---',
+    State.LETTER_K: '-.-',
+    State.LETTER_L: '.-..',
+    State.LETTER_M: '--',
+    State.LETTER_N: '-.',
+    State.LETTER_O: '---',
+    State.LETTER_P: '.--.',
+    State.LETTER_Q: '--.-',
+    State.LETTER_R: '.-.',
+    State.LETTER_S: '...',
+    State.LETTER_T: '-',
+    State.LETTER_U: '..-',
+    State.LETTER_V: '...-',
+    State.LETTER_W: '.--',
+    State.LETTER_X: '-..-',
+    State.LETTER_Y: '-.--',
+    State.LETTER_Z: '--..',
+    State.NUMBER_0: '-----',
+    State.NUMBER_1: '.----',
+    State.NUMBER_2: '..---',
+    State.NUMBER_3: '...--',
+    State.NUMBER_4: '....-',
+    State.NUMBER_5: '.....',
+    State.NUMBER_6: '-....',
+    State.NUMBER_7: '--...',
+    State.NUMBER_8: '---..',
+    State.NUMBER_9: '----.',
+    State.SPECIAL_CH: '----',
+    State.SPECIAL_AE: '.-.-',
+    State.SPECIAL_OE: '---.',
+    State.SPECIAL_UE: '..--',
+    State.SPECIAL_AMPERSAND: '.-...',
+}
+
+
+def _compile() -> tuple:
     """
-    A decoder for morse signals.
+    Compiles the tree of states into a dense transition table.
+    :return: (states, transitions) with the states in table order and the index of the next state for every index of
+             a state and signal as 'state index * 2 + (1 if DAH else 0)'
     """
+    states = list(State)
+    index = {state: position for position, state in enumerate(states)}
+    by_code = {code: state for state, code in CODES.items()}
+    by_code[''] = State.INITIAL
 
-    # All states:
-    # DIT, DAH, "INITIAL", PAUSE_SHORT, PAUSE_MEDIUM, PAUSE_LONG
+    transitions = [index[State.ERROR]] * (2 * len(states))
+    for state, code in CODES.items():
+        transitions[2 * index[by_code[code[:-1]]] + (code[-1] == '-')] = index[state]
+    return tuple(states), tuple(transitions)
 
-    __current_state = State.INITIAL
-    __last_signal = Signal.PAUSE_LONG
 
-    message = ''
+_STATES, _TRANSITIONS = _compile()
+_VALUES = tuple(state.value for state in _STATES)
+_INITIAL = _STATES.index(State.INITIAL)
+
+
+def _describe(position: int) -> str:
+    """
+    Words the log record of a transition like the original decoder did: a transition into the error state is only
+    logged as 'ERROR' and Ä is spelled 'AE'.
+    :param position: The index of the transition as 'state index * 2 + (1 if DAH else 0)'
+    :return: The log record
+    """
+    source, target = _STATES[position // 2], _STATES[_TRANSITIONS[position]]
+    if target is State.ERROR:
+        return 'ERROR'
+    return '%s -> %s' % (source.value.strip('-'), 'AE' if target is State.SPECIAL_AE else target.value.strip('-'))
 
-    def __init__(self, _logger: logging.Logger):
+
+_MESSAGES = tuple(_describe(position) for position in range(len(_TRANSITIONS)))
+
+
+class Decoder:
+    """
+    A decoder for morse signals.
+    """
+
+    __slots__ = ('logger', '_state', '_mark', '_characters', '_sink', '_verbose')
+
+    def __init__(self, _logger: logging.Logger, sink=None):
+        """
+        Configures the decoder.
+        :param _logger: Receives every processed signal if its level includes INFO at the time of creation
+        :param sink: Optional callable that receives the decoded text as soon as it is complete
+        """
         self.logger = _logger
+        self._sink = sink
+        self._verbose = _logger.isEnabledFor(logging.INFO)
+
+        # Index of the current state and whether the last signal was a DIT or DAH
+        self._state = _INITIAL
+        self._mark = False
+        self._characters = list()
+
+    @property
+    def message(self) -> str:
+        """
+        :return: The decoded message
+        """
+        if len(self._characters) > 1:
+            self._characters = [''.join(self._characters)]
+        return self._characters[0] if self._characters else ''
+
+    @message.setter
+    def message(self, message: str):
+        self._characters = [message] if message else []
 
     def decode(self, signal: Signal):
         """ Decode a morse stream step by step."""
 
-        if (signal == Signal.SHORT or signal == Signal.LONG) and (
-                self.__last_signal == Signal.SHORT or self.__last_signal == Signal.LONG):
-            self.logger.info("ERROR! There has to be a pause in between two signals!")
-            self.message += "(E!)"
-
-        elif signal == Signal.SHORT:
-            self.logger.info("DIT")
-            self.__last_signal = Signal.SHORT
-            self.__process_dit()
-        elif signal == Signal.LONG:
-            self.logger.info("DAH")
-            self.__last_signal = Signal.LONG
-            self.__process_dah()
-        elif signal == Signal.PAUSE_SHORT:
-            self.logger.info("PAUSE_SHORT")
-            self.__last_signal = Signal.PAUSE_SHORT
-            self.__process_short_pause()
-        elif signal == Signal.PAUSE_MEDIUM:
-            self.logger.info("PAUSE_MEDIUM")
-            self.__last_signal = Signal.PAUSE_MEDIUM
-            self.__process_medium_pause()
-        elif signal == Signal.PAUSE_LONG:
-            self.logger.info("PAUSE_LONG")
-            self.__last_signal = Signal.PAUSE_LONG
-            self.__process_long_pause()
-        else:
+        if signal is Signal.SHORT or signal is Signal.LONG:
+            if self._mark:
+                if self._verbose:
+                    self.logger.info("ERROR! There has to be a pause in between two signals!")
+                self._emit("(E!)")
+            else:
+                self._mark = True
+                position = 2 * self._state + (signal is Signal.LONG)
+                self._state = _TRANSITIONS[position]
+                if self._verbose:
+                    self.logger.info("DIT" if signal is Signal.SHORT else "DAH")
+                    self.logger.info(_MESSAGES[position])
+
+        elif signal is Signal.PAUSE_SHORT:
+            self._mark = False
+            if self._verbose:
+                self.logger.info("PAUSE_SHORT")
+                self.logger.info("New signal")
+
+        elif signal is Signal.PAUSE_MEDIUM:
+            self._mark = False
+            self._emit(_VALUES[self._state])
+            self._state = _INITIAL
+            if self._verbose:
+                self.logger.info("PAUSE_MEDIUM")
+                self.logger.info("New character")
+
+        elif signal is Signal.PAUSE_LONG:
+            self._mark = False
+            self._emit(_VALUES[self._state] + " ")
+            self._state = _INITIAL
+            if self._verbose:
+                self.logger.info("PAUSE_LONG")
+                self.logger.info("New word")
+
+        elif self._verbose:
             self.logger.info("ERROR!")
 
-    def __process_dit(self):
-        """ Process a short 'DIT' signal."""
-        if self.__current_state == State.INITIAL:
-            self.__current_state = State.LETTER_E
-            self.logger.info("INITIAL -> E")
-        elif self.__current_state == State.LETTER_E:
-            self.__current_state = State.LETTER_I
-            self.logger.info("E -> I")
-        elif self.__current_state == State.LETTER_I:
-            self.__current_state = State.LETTER_S
-            self.logger.info("I -> S")
-        elif self.__current_state == State.LETTER_S:
-            self.__current_state = State.LETTER_H
-            self.logger.info("S -> H")
-        elif self.__current_state == State.LETTER_H:
-            self.__current_state = State.NUMBER_5
-            self.logger.info("H -> 5")
-
-        elif self.__current_state == State.LETTER_T:
-            self.__current_state = State.LETTER_N
-            self.logger.info("T -> N")
-        elif self.__current_state == State.LETTER_N:
-            self.__current_state = State.LETTER_D
-            self.logger.info("N -> D")
-        elif self.__current_state == State.LETTER_D:
-            self.__current_state = State.LETTER_B
-            self.logger.info("D -> B")
-        elif self.__current_state == State.LETTER_B:
-            self.__current_state = State.NUMBER_6
-            self.logger.info("B -> 6")
-
-        elif self.__current_state == State.LETTER_M:
-            self.__current_state = State.LETTER_G
-            self.logger.info("M -> G")
-        elif self.__current_state == State.LETTER_G:
-            self.__current_state = State.LETTER_Z
-            self.logger.info("G -> Z")
-        elif self.__current_state == State.LETTER_Z:
-            self.__current_state = State.NUMBER_7
-            self.logger.info("Z -> 7")
-
-        elif self.__current_state == State.LETTER_O:
-            self.__current_state = State.SPECIAL_OE
-            self.logger.info("O -> Ö")
-        elif self.__current_state == State.SPECIAL_OE:
-            self.__current_state = State.NUMBER_8
-            self.logger.info("Ö -> 8")
-
-        elif self.__current_state == State.SPECIAL_CH:
-            self.__current_state = State.NUMBER_9
-            self.logger.info("CH -> 9")
-
-        elif self.__current_state == State.LETTER_A:
-            self.__current_state = State.LETTER_R
-            self.logger.info("A -> R")
-        elif self.__current_state == State.LETTER_R:
-            self.__current_state = State.LETTER_L
-            self.logger.info("R -> L")
-        elif self.__current_state == State.LETTER_L:
-            self.__current_state = State.SPECIAL_AMPERSAND
-            self.logger.info("L -> &")
-
-        elif self.__current_state == State.LETTER_W:
-            self.__current_state = State.LETTER_P
-            self.logger.info("W -> P")
-
-        elif self.__current_state == State.LETTER_U:
-            self.__current_state = State.LETTER_F
-            self.logger.info("U -> F")
-
-        elif self.__current_state == State.LETTER_K:
-            self.__current_state = State.LETTER_C
-            self.logger.info("K -> C")
-
-        else:
-            self.__current_state = State.ERROR
-            self.logger.info("ERROR")
-
-    def __process_dah(self):
-        """ Process a long 'DAH' signal."""
-        if self.__current_state == State.INITIAL:
-            self.__current_state = State.LETTER_T
-            self.logger.info("INITIAL -> T")
-        elif self.__current_state == State.LETTER_T:
-            self.__current_state = State.LETTER_M
-            self.logger.info("T -> M")
-        elif self.__current_state == State.LETTER_M:
-            self.__current_state = State.LETTER_O
-            self.logger.info("M -> O")
-        elif self.__current_state == State.LETTER_O:
-            self.__current_state = State.SPECIAL_CH
-            self.logger.info("O -> CH")
-        elif self.__current_state == State.SPECIAL_CH:
-            self.__current_state = State.NUMBER_0
-            self.logger.info("CH -> 0")
-
-        elif self.__current_state == State.LETTER_E:
-            self.__current_state = State.LETTER_A
-            self.logger.info("E -> A")
-        elif self.__current_state == State.LETTER_A:
-            self.__current_state = State.LETTER_W
-            self.logger.info("A -> W")
-        elif self.__current_state == State.LETTER_W:
-            self.__current_state = State.LETTER_J
-            self.logger.info("W -> J")
-        elif self.__current_state == State.LETTER_J:
-            self.__current_state = State.NUMBER_1
-            self.logger.info("J -> 1")
-
-        elif self.__current_state == State.LETTER_I:
-            self.__current_state = State.LETTER_U
-            self.logger.info("I -> U")
-        elif self.__current_state == State.LETTER_U:
-            self.__current_state = State.SPECIAL_UE
-            self.logger.info("U -> Ü")
-        elif self.__current_state == State.SPECIAL_UE:
-            self.__current_state = State.NUMBER_2
-            self.logger.info("Ü -> 2")
-
-        elif self.__current_state == State.LETTER_S:
-            self.__current_state = State.LETTER_V
-            self.logger.info("S -> V")
-        elif self.__current_state == State.LETTER_V:
-            self.__current_state = State.NUMBER_3
-            self.logger.info("V -> 3")
-
-        elif self.__current_state == State.LETTER_H:
-            self.__current_state = State.NUMBER_4
-            self.logger.info("H -> 4")
-
-        elif self.__current_state == State.LETTER_N:
-            self.__current_state = State.LETTER_K
-            self.logger.info("N -> K")
-        elif self.__current_state == State.LETTER_K:
-            self.__current_state = State.LETTER_Y
-            self.logger.info("K -> Y")
-
-        elif self.__current_state == State.LETTER_D:
-            self.__current_state = State.LETTER_X
-            self.logger.info("D -> X")
-
-        elif self.__current_state == State.LETTER_G:
-            self.__current_state = State.LETTER_Q
-            self.logger.info("G -> Q")
-
-        elif self.__current_state == State.LETTER_R:
-            self.__current_state = State.SPECIAL_AE
-            self.logger.info("R -> AE")
-
-        else:
-            self.__current_state = State.ERROR
-            self.logger.info("ERROR")
-
-    def __process_short_pause(self):
-        """ Process a short pause."""
-        self.logger.info("New signal")
-
-    def __process_medium_pause(self):
-        """ Process a medium pause."""
-        self.message += self.__current_state.value
-        self.__current_state = State.INITIAL
-        self.logger.info("New character")
-
-    def __process_long_pause(self):
-        """ Process a long pause."""
-        self.message += self.__current_state.value
-        self.message += " "
-        self.__current_state = State.INITIAL
-        self.logger.info("New word")
+    def _emit(self, text: str):
+        self._characters.append(text)
+        if self._sink is not None:
+            self._sink(text)
+
+
+def _compile_codes() -> np.ndarray:
+    """
+    Compiles the output of every bit-packed code, i.e. '1 << length | bits' with a set bit for every DAH.
+    :return: The text for the codes of medium pauses followed by the text for the codes of long pauses
+    """
+    values = np.full(1 << 6, State.ERROR.value, dtype=object)
+    values[1] = State.INITIAL.value
+    for state, code in CODES.items():
+        values[int('1' + code.replace('.', '0').replace('-', '1'), 2)] = state.value
+    return np.concatenate((values, values + ' '))
+
+
+_TEXTS = _compile_codes()
+
+
+def decode_signals(signals: np.ndarray) -> str:
+    """
+    Decodes a whole recording at once. The result is the same as the message of a Decoder that got every signal.
+    :param signals: An array with the value of a Signal for every signal, any other value is ignored
+    :return: The decoded message
+    """
+    signals = np.asarray(signals)
+    signals = signals[(signals >= Signal.SHORT.value) & (signals <= Signal.PAUSE_LONG.value)]
+    metrics.annotate(symbols=len(signals))
+
+    # A DIT or DAH right after another one is an error and does not change the state
+    marks = (signals == Signal.SHORT.value) | (signals == Signal.LONG.value)
+    errors = marks & np.concatenate(([False], marks[:-1]))
+    marks &= ~errors
+
+    # Every medium or long pause ends a character, so it ends a group of DITs and DAHs
+    ends = (signals == Signal.PAUSE_MEDIUM.value) | (signals == Signal.PAUSE_LONG.value)
+    groups = np.cumsum(ends) - ends
+    n_groups = int(ends.sum())
+
+    # Pack the DITs and DAHs of every group into an integer code
+    member = groups[marks]
+    lengths = np.bincount(member, minlength=n_groups + 1)
+    position = np.arange(len(member)) - (np.cumsum(lengths) - lengths)[member]
+    shifts = np.clip(lengths[member] - 1 - position, 0, 6)
+    dahs = signals[marks] == Signal.LONG.value
+    bits = np.bincount(member, weights=dahs * np.left_shift(1, shifts), minlength=n_groups + 1).astype(np.int64)
+
+    lengths = lengths[:n_groups]
+    codes = np.where(lengths < 6, np.left_shift(1, np.minimum(lengths, 5)) | bits[:n_groups], 0)
+    codes += len(_TEXTS) // 2 * (signals[ends] == Signal.PAUSE_LONG.value)
+
+    events = np.flatnonzero(ends | errors)
+    texts = np.full(len(events), "(E!)", dtype=object)
+    texts[ends[events]] = _TEXTS[codes]
+    return ''.join(texts.tolist())
+
+
+def decode_labels(labels: np.ndarray, mapping: dict) -> str:
+    """
+    Decodes a whole recording of labels at once.
+    :param labels: The label of every signal
+    :param mapping: A Signal for every label, labels without a Signal are ignored
+    :return: The decoded message
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    lookup = np.zeros(max(list(mapping) + [int(labels.max()) if len(labels) else 0]) + 1, dtype=np.uint8)
+    for label, signal in mapping.items():
+        lookup[label] = signal.value
+    return decode_signals(lookup[labels])
 
 
 if __name__ == "__main__":
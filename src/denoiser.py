@@ -1,22 +1,124 @@
+import numpy as np
+
+
 class Denoiser:
     """
-    A tool to reduce noise in a given audio signal.
+    A tool to reduce noise in a given audio signal, chunk by chunk: a band-pass filter around the tone removes the
+    noise of the other frequencies and a gate driven by the envelope of the tone mutes the pauses.
     """
 
-    def __init__(self, level: float, smoothing: bool) -> None:
+    def __init__(self, level: float = 0.1, smoothing: bool = True, tone: float = None, rate: int = 8000,
+                 bandwidth: float = 100.0, order: int = 4, cutoff: float = None, decay: float = 10.0,
+                 wpm: int = 12) -> None:
         """
         Sets the global configuration for this noise cancelling processor.
-        :param level:
-        :param smoothing:
+        :param level: Fraction of the peak envelope below which the signal is muted, 0.0 disables the gate
+        :param smoothing: Should the envelope be smoothed by a low-pass filter (or follow the rectified signal)?
+        :param tone: The frequency of the tone in Hz, it is acquired from the first chunk of a recording if not set
+        :param rate: The sample rate
+        :param bandwidth: Width of the pass band around the tone in Hz
+        :param order: Order of the band-pass filter
+        :param cutoff: Cutoff frequency of the smoothing low-pass filter in Hz, derived from the speed if not set
+        :param decay: Time in seconds in which the peak envelope decays to a third, so that the gate follows fading
+        :param wpm: Expected speed as defined by 'words per minute'
         """
         self._level = level
-        self._smooting = smoothing
+        self._smoothing = smoothing
+        self.tone = tone
+        self.rate = rate
+        self.bandwidth = bandwidth
+        self.order = order
+
+        # A DIT lasts about 7 periods of the cutoff frequency, a lower one would smear short pauses and join the DITs
+        self.cutoff = cutoff if cutoff is not None else 6.0 * wpm
+        self.decay = decay
+
+        self._fixed = tone is not None
+        self._bandpass = None
+        self._lowpass = None
+        self._bandpass_state = None
+        self._lowpass_state = None
+        self._peak = 0.0
+
+        # Envelope of the last chunk, the rectified signal is kept in a buffer that is reused for chunks of equal size
+        self.envelope = np.empty(0)
+        self._buffer = np.empty(0)
+
+    def reset(self) -> None:
+        """
+        Prepares the processing of a new recording: the filter states are cleared and the tone is acquired anew
+        unless a fixed tone is configured.
+        """
+        if not self._fixed:
+            self.tone = None
+            self._bandpass = None
+        self._bandpass_state = None
+        self._lowpass_state = None
+        self._peak = 0.0
+
+    def acquire(self, samples: np.ndarray) -> float:
+        """
+        Finds the tone as the loudest frequency within the spectrum of the given samples.
+        :param samples: A 1-D array of samples
+        :return: The frequency of the tone in Hz
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+        frequencies = np.fft.rfftfreq(len(samples), 1 / self.rate)
+
+        # Ignore hum and everything above the usable part of the spectrum
+        band = (frequencies >= 100.0) & (frequencies <= 0.45 * self.rate)
+        self.tone = float(frequencies[band][np.argmax(spectrum[band])]) if band.any() else self.rate / 8
+        self._bandpass = None
+        return self.tone
 
-    def process_chunk(self, chunk: bytearray) -> bytearray:
+    def _design(self) -> None:
+        """
+        Designs the filters as second-order sections, whose state is carried over from chunk to chunk.
+        """
+        from scipy.signal import butter
+
+        nyquist = self.rate / 2
+        low = max(self.tone - self.bandwidth / 2, 1.0) / nyquist
+        high = min(self.tone + self.bandwidth / 2, nyquist - 1.0) / nyquist
+        self._bandpass = butter(self.order, [low, high], btype='bandpass', output='sos')
+        self._lowpass = butter(2, self.cutoff / nyquist, output='sos')
+
+        # The recording is thought to start with silence
+        self._bandpass_state = np.zeros((len(self._bandpass), 2))
+        self._lowpass_state = np.zeros((len(self._lowpass), 2))
+
+    def process_chunk(self, chunk: np.ndarray) -> np.ndarray:
         """
         Optimizes a given chunk of sound data with the set global configuration.
-        :param chunk:
+        :param chunk: The samples of the chunk, a writable float64 array is processed in place
         :return: The optimized version of the given sound.
         """
-        print(len(chunk))
+        from scipy.signal import sosfilt
+
+        if not isinstance(chunk, np.ndarray) or chunk.dtype != np.float64 or not chunk.flags.writeable:
+            chunk = np.array(chunk, dtype=np.float64)
+        if len(chunk) == 0:
+            return chunk
+
+        if self.tone is None:
+            self.acquire(chunk)
+        if self._bandpass is None or self._bandpass_state is None:
+            self._design()
+
+        filtered, self._bandpass_state = sosfilt(self._bandpass, chunk, zi=self._bandpass_state)
+
+        # Rectify the tone and (optionally) smooth it to its envelope
+        if len(self._buffer) != len(chunk):
+            self._buffer = np.empty(len(chunk))
+        envelope = np.abs(filtered, out=self._buffer)
+        if self._smoothing:
+            envelope, self._lowpass_state = sosfilt(self._lowpass, envelope, zi=self._lowpass_state)
+        self.envelope = envelope
+
+        # The peak decays slowly, so that the gate keeps opening during a fading
+        self._peak = max(self._peak * 3 ** (-len(chunk) / (self.decay * self.rate)), float(envelope.max()))
+
+        np.greater_equal(envelope, self._level * self._peak, out=chunk)
+        np.multiply(filtered, chunk, out=chunk)
         return chunk
@@ -1,7 +1,15 @@
-import csv
-import random
+import wave
 from _datetime import datetime
 
+import numpy as np
+
+import metrics
+import series
+from decoder import CODES
+
+# Morse code of every character that can be encoded
+ALPHABET = {state.value: code for state, code in CODES.items() if len(state.value) == 1}
+
 
 class Generator:
     """
@@ -10,97 +18,118 @@ class Generator:
 
     _reference_loundness = 0.65
 
-    _generated_endtimes_list = list()
-    _generated_loudness_list = list()
+    # Number of message characters that are processed at once
+    _block = 1 << 20
 
-    def __init__(self, noise: float, deviation_duration: float, deviation_loudness: float, wpm: int):
+    _endtimes: np.ndarray
+    _loudness: np.ndarray
+
+    def __init__(self, noise: float, deviation_duration: float, deviation_loudness: float, wpm: int,
+                 seed: int = None):
         """
         Configures the generator.
         :param noise: The added noise to the signal in percent
         :param deviation_duration: The variance of the duration of a signal in percent
         :param deviation_loudness: The variance of the loudness of a signal in percent
         :param wpm: Speed as defined by 'words per minute'
+        :param seed: Seed of the random number generator, simulations with the same seed are identical
         """
+        self._endtimes = np.empty(0)
+        self._loudness = np.empty(0)
+        self._rng = np.random.RandomState(seed)
+
         self._deviation_duration = deviation_duration
         self._deviation_loudness = deviation_loudness
 
         self._noise = noise
         self._dit_speed = self._calculate_speed_from_wpm(wpm)
 
+    @staticmethod
+    def encode(text: str) -> str:
+        """
+        Encodes a plain text as morse code message.
+        :param text: The text, characters without morse code are left out
+        :return: A message comprised of dots, dashes and spaces as expected by simulate()
+        """
+        words = list()
+        for word in text.upper().split():
+            codes = [ALPHABET[character] for character in word if character in ALPHABET]
+            if codes:
+                words.append(' '.join(codes))
+        return '   '.join(words)
+
     def simulate(self, message: str):
         """
         Generates a simulation based on the passed morse code message.
         :param message: A message comprised of dots, dashes and spaces
         """
+        durations = list()
+        loudness = list()
 
-        _generated_durations_list = list()
-
-        pause_counter: int = 0
-        is_still_pause: bool = True
+        # Weight of the characters since the last signal and whether a signal has been generated yet
+        pending = 0
         first_run = True
-        duration = 0.0
-        loudness = 0.0
-
-        for signal in message:
-            if signal == '.':
-                # Dit signal
-                is_still_pause = False
-                duration = self._generate_duration(1)
-                loudness = self._generate_loudness(self._reference_loundness)
-            elif signal == '-':
-                # Dah signal
-                is_still_pause = False
-                duration = self._generate_duration(3)
-                loudness = self._generate_loudness(self._reference_loundness)
-            elif signal == ' ':
-                # Pause signal
-                pause_counter += 1
-            else:
-                print("(!) ERROR (!) Invalid character within the message")
-
-            # Add a short pause after every signal
-            pause_counter += 1
-            if not is_still_pause:
-                if first_run:
-                    first_run = False
-                else:
-                    pause_duration = self._generate_duration(pause_counter)
-                    pause_loudness = self._generate_loudness(0)
-
-                    # Save pause before signal
-                    _generated_durations_list.append(pause_duration)
-                    self._generated_loudness_list.append(pause_loudness)
-
-                _generated_durations_list.append(duration)
-                self._generated_loudness_list.append(loudness)
-
-                # Reset
-                pause_counter = 0
-                is_still_pause = True
-
-        endtime = 0.0
-        for duration in _generated_durations_list:
-            endtime += duration
-            self._generated_endtimes_list.append(endtime)
-
-    def _generate_duration(self, factor: int) -> float:
-
-        min_duration = factor * self._dit_speed * (100 - self._deviation_duration) / 100.0
-        max_duration = factor * self._dit_speed * (100 + self._deviation_duration) / 100.0
-
-        return random.uniform(min_duration, max_duration)
-
-    def _generate_loudness(self, base: float) -> float:
+        invalid = 0
+
+        for offset in range(0, len(message), self._block):
+            characters = np.frombuffer(message[offset:offset + self._block].encode('ascii', 'replace'),
+                                       dtype=np.uint8)
+            marks = (characters == ord('.')) | (characters == ord('-'))
+            spaces = characters == ord(' ')
+            invalid += len(characters) - int(marks.sum()) - int(spaces.sum())
+
+            # A short pause follows every character and a space adds another one
+            weights = np.cumsum(1 + spaces, dtype=np.int64)
+            positions = np.flatnonzero(marks)
+            if len(positions) == 0:
+                pending += int(weights[-1])
+                continue
+
+            factors = np.concatenate(([0], np.diff(weights[positions])))
+            factors[0] = pending + weights[positions[0]]
+            pending = int(weights[-1] - weights[positions[-1]])
+
+            # Every signal is preceded by a pause, except for the very first one
+            block_durations = np.empty(2 * len(positions))
+            block_durations[0::2] = self._generate_duration(factors)
+            block_durations[1::2] = self._generate_duration(np.where(characters[positions] == ord('.'), 1, 3))
+            block_loudness = np.empty(2 * len(positions))
+            block_loudness[0::2] = self._generate_loudness(0, len(positions))
+            block_loudness[1::2] = self._generate_loudness(self._reference_loundness, len(positions))
+
+            if first_run:
+                first_run = False
+                block_durations = block_durations[1:]
+                block_loudness = block_loudness[1:]
+
+            durations.append(block_durations)
+            loudness.append(block_loudness)
+
+        if invalid:
+            print("(!) ERROR (!) %d invalid characters within the message" % invalid)
+
+        self._endtimes = np.cumsum(np.concatenate(durations)) if durations else np.empty(0)
+        self._loudness = np.concatenate(loudness) if loudness else np.empty(0)
+        metrics.annotate(items=len(message), symbols=len(self._endtimes))
+
+    def _generate_duration(self, factors: np.ndarray) -> np.ndarray:
+
+        min_duration = factors * self._dit_speed * (100 - self._deviation_duration) / 100.0
+        max_duration = factors * self._dit_speed * (100 + self._deviation_duration) / 100.0
+
+        return self._rng.uniform(min_duration, max_duration)
+
+    def _generate_loudness(self, base: float, size: int) -> np.ndarray:
 
         min_noise = self._noise * (100 - self._deviation_loudness) / 100.0
         max_noise = self._noise * (100 + self._deviation_loudness) / 100.0
 
-        noise = random.uniform(min_noise, max_noise) / 100.0
+        noise = self._rng.uniform(min_noise, max_noise, size) / 100.0
 
         min_signal = base * (100 - self._deviation_loudness) / 100.0
         max_signal = base * (100 + self._deviation_loudness) / 100.0
 
-        signal = random.uniform(min_signal, max_signal)
+        signal = self._rng.uniform(min_signal, max_signal, size)
         return noise + signal
 
     def _calculate_speed_from_wpm(self, wpm: int) -> float:
@@ -115,21 +144,79 @@ class Generator:
         """
         dit_signals_per_minute: int = wpm * 50
         seconds_per_dit_signal: float = 60.0 / dit_signals_per_minute
-
-        print(" - Calculated a speed of %.2fs s for a dit signal for a given 'words per minute' value of %d"
-              % (seconds_per_dit_signal, wpm))
         return seconds_per_dit_signal
 
-    def export(self):
-        filename = 'simulation_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.csv'
-        print(" - Writing generated simulation data to '%s'." % filename)
+    def get_series(self) -> tuple:
+        """
+        Returns the generated simulation.
+        :return: (endtimes, loudness) as arrays with the end time in seconds and the loudness of every signal
+        """
+        return self._endtimes, self._loudness
+
+    def render(self, filename: str, tone: float = 600.0, rate: int = 8000, volume: float = 0.5, ramp: float = 0.005,
+               noise: float = 0.05, fading: float = 0.0, fading_period: float = 10.0, drift: float = 0.0,
+               drift_period: float = 60.0, padding: float = 0.5, block: int = 1 << 16):
+        """
+        Renders the simulation as keyed sine tone into a 16 bit mono wave file, one block of samples at a time.
+        :param filename: The path to the wave file
+        :param tone: Frequency of the tone in Hz
+        :param rate: The sample rate
+        :param volume: Amplitude of a signal with a loudness of 1.0 relative to full scale
+        :param ramp: Rise and fall time of the raised cosine edges of a signal in seconds
+        :param noise: Standard deviation of the added white noise relative to full scale
+        :param fading: Depth of a slow periodic fading between 0.0 (none) and 1.0 (complete)
+        :param fading_period: Period of the fading in seconds
+        :param drift: Maximum deviation of the tone frequency in Hz
+        :param drift_period: Period of the frequency drift in seconds
+        :param padding: Silence before the first and after the last signal in seconds
+        :param block: Number of samples that are synthesized at once
+        """
+        endtimes = self._endtimes if len(self._endtimes) else np.zeros(1)
+        loudness = self._loudness if len(self._loudness) else np.zeros(1)
+        starttimes = np.concatenate(([0.0], endtimes[:-1]))
+        total = int(round((endtimes[-1] + 2 * padding) * rate))
+        metrics.annotate(frames=total, buffer=min(block, total))
+
+        with wave.open(filename, 'wb') as waveform:
+            waveform.setnchannels(1)
+            waveform.setsampwidth(2)
+            waveform.setframerate(rate)
 
-        with open(filename, 'w', newline='') as csv_file:
-            writer = csv.writer(csv_file, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(['endtime'] + ['loudness'])
+            for offset in range(0, total, block):
+                times = np.arange(offset, min(offset + block, total)) / rate
+                signal_times = times - padding
+
+                # Every second signal (starting with the first one) is a dit or dah, the others are pauses
+                index = np.searchsorted(endtimes, signal_times, side='right')
+                index = np.minimum(index, len(endtimes) - 1)
+                keyed = (index % 2 == 0) & (signal_times >= 0) & (signal_times < endtimes[index])
+
+                edges = np.minimum(signal_times - starttimes[index], endtimes[index] - signal_times)
+                shape = np.sin(np.pi / 2 * np.clip(edges / ramp, 0.0, 1.0)) ** 2
+                amplitude = np.where(keyed, loudness[index] * shape, 0.0)
+
+                if fading:
+                    amplitude *= 1 - fading * (0.5 - 0.5 * np.cos(2 * np.pi * times / fading_period))
+
+                # Phase of a tone whose frequency drifts sinusoidally around the given one
+                phase = 2 * np.pi * tone * times + drift * drift_period * (1 - np.cos(2 * np.pi * times / drift_period))
+                samples = volume * amplitude * np.sin(phase) + self._rng.normal(0.0, noise, len(times))
+
+                pcm = np.clip(np.round(samples * 32767), -32768, 32767).astype('<i2')
+                waveform.writeframes(pcm.tobytes())
+
+    def export(self, binary: bool = False) -> str:
+        """
+        Writes the simulated signals to a file named after the current time.
+        :param binary: Should a binary series file be written instead of a CSV file?
+        :return: The path to the file
+        """
+        filename = 'simulation_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ('.series' if binary else '.csv')
+        print(" - Writing generated simulation data to '%s'." % filename)
 
-            for endtime, loudness in zip(self._generated_endtimes_list, self._generated_loudness_list):
-                writer.writerow([round(endtime, 4)] + [round(loudness, 4)])
+        if binary:
+            return series.write(filename, self._endtimes, self._loudness)
+        return series.write_csv(filename, self._endtimes, self._loudness)
 
 
 if __name__ == "__main__":
@@ -156,3 +243,4 @@ if __name__ == "__main__":
     generator = Generator(base_noise, deviation_duration, deviation_loudness, words_per_minute)
     generator.simulate(message)
     generator.export()
+    generator.render('simulation_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.wav')
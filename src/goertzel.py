@@ -0,0 +1,104 @@
+import numpy as np
+
+from stft import Stft
+
+
+class Goertzel(Stft):
+    """
+    A narrow-band tone detector that only tracks the frequency bins around the tone of the signal.
+    """
+
+    def __init__(self, frame_size: int = 256, hop: int = None, rate: int = 8000, survey: float = 2.0,
+                 neighbours: int = 1, tone: float = None, block: int = 4096):
+        """
+        Configures the detector.
+        :param frame_size: Number of samples per frame
+        :param hop: Number of samples between the starts of two frames (defaults to the frame size)
+        :param rate: The sample rate of the signal
+        :param survey: Duration in seconds at the beginning of a recording that is used to find the tone
+        :param neighbours: Number of bins on each side of the tone bin that are tracked as well
+        :param tone: A fixed tone frequency in Hz, the tone is acquired from every recording (see reset) if not set
+        :param block: Number of frames that are processed together in one batch
+        """
+        super().__init__(frame_size, hop, block=block)
+        self.rate = rate
+        self.survey = survey
+        self.neighbours = neighbours
+        self.tone = tone
+        self.bin = None if tone is None else round(tone * frame_size / rate)
+        self._bases = dict()
+
+    def acquire(self, samples: np.ndarray) -> int:
+        """
+        Finds the frequency bin of the tone within the averaged spectrum of the first seconds of the samples.
+        :param samples: A 1-D array of samples
+        :return: The index of the frequency bin with the most energy
+        """
+        survey = samples[:max(int(self.survey * self.rate), self.frame_size)]
+        frames = self.frames(survey)
+        if len(frames) == 0:
+            frames = np.zeros((1, self.frame_size))
+            frames[0, :len(survey)] = survey
+        spectrum = self.spectra(frames).mean(axis=0)
+        self.bin = self.LOWER_BOUND + int(np.argmax(spectrum))
+        return self.bin
+
+    def reset(self) -> None:
+        """
+        Prepares the analysis of a new recording, whose tone is acquired anew unless a fixed tone is configured.
+        """
+        if self.tone is None:
+            self.bin = None
+
+    def _basis(self) -> np.ndarray:
+        """
+        Returns the cached cosines and sines of the tracked bins.
+        :return: An array of the shape (frame size, 2 * tracked bins), the cosines followed by the sines
+        """
+        if self.bin not in self._bases:
+            bins = np.arange(self.bin - self.neighbours, self.bin + self.neighbours + 1)
+            phases = 2 * np.pi * np.outer(np.arange(self.frame_size), bins) / self.frame_size
+            self._bases[self.bin] = np.hstack((np.cos(phases), np.sin(phases)))
+        return self._bases[self.bin]
+
+    def magnitudes(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Correlates a batch of frames with the tracked bins, which yields the same magnitudes as the Goertzel recurrence
+        with a single matrix product instead of a step per sample.
+        :param frames: An array of the shape (frames, frame size)
+        :return: The scaled magnitudes of the tracked bins for every frame
+        """
+        products = frames @ self._basis()
+        count = products.shape[1] // 2
+        return np.hypot(products[:, :count], products[:, count:]) / (128 * self.frame_size)
+
+    def band_extrema(self, samples: np.ndarray, partial: bool = True) -> tuple:
+        """
+        Calculates the maximum and minimum of the tracked bins of every frame.
+        :param samples: A 1-D array of samples
+        :param partial: Should a trailing partial frame be analysed as well?
+        :return: (maxima, minima) as two arrays with one value per frame
+        """
+        samples = np.asarray(samples)
+        if self.bin is None:
+            self.acquire(samples)
+
+        frames = self.frames(samples)
+        maxima = np.empty(self.frame_count(len(samples)) if partial else len(frames))
+        minima = np.empty(len(maxima))
+
+        for start in range(0, len(frames), self.block):
+            magnitudes = self.magnitudes(frames[start:start + self.block].astype(np.float64))
+            maxima[start:start + len(magnitudes)] = magnitudes.max(axis=1)
+            minima[start:start + len(magnitudes)] = magnitudes.min(axis=1)
+
+        # A trailing partial frame is padded with silence
+        if len(maxima) > len(frames):
+            tail = np.zeros((1, self.frame_size))
+            remainder = samples[len(frames) * self.hop:]
+            tail[0, :len(remainder)] = remainder
+            magnitudes = self.magnitudes(tail)
+            maxima[-1] = magnitudes.max()
+            minima[-1] = magnitudes.min()
+
+        return maxima, minima
@@ -1,12 +1,16 @@
-import csv
 import sys
 import wave
-from _datetime import datetime
 
-import matplotlib.pyplot as plt
 import numpy as np
-import pyaudio
-from scipy.fftpack import fft
+
+import metrics
+import series
+from denoiser import Denoiser
+from goertzel import Goertzel
+from live import LiveDecoder, Microphone, StreamDecoder
+from segmenter import segment
+from stft import Stft, gate
+from wavfile import WAVE_FORMAT_PCM, WaveFile
 
 
 # Based on the source code of 'Rattlesnake', a script for active noise cancellation.
@@ -19,31 +23,71 @@ from scipy.fftpack import fft
 
 class Input:
 
-    def __init__(self):
+    def __init__(self, frame_size: int = 256, hop: int = None, detector: str = 'fft', plot: bool = False,
+                 denoise: bool = False):
+        """
+        Configures the input.
+        :param frame_size: Number of samples per analysed frame
+        :param hop: Number of samples between the starts of two frames (defaults to the frame size)
+        :param detector: Tone detector, either 'fft' (full spectrum) or 'goertzel' (tracks the tone only)
+        :param plot: Should diagnostic plots be displayed?
+        :param denoise: Should the audio be band-pass filtered around the tone and gated before the tone detection?
+        """
 
         # stream constants
-        self.CHUNK = 256
-        self.FORMAT = pyaudio.paInt16
+        self.CHUNK = frame_size
+        self.HOP = hop or frame_size
         self.CHANNELS = 1
         self.RATE = 8000
         self.pause = False
+        self.plot = plot
 
         # Loudness area in which the signal is thought to be the same
         self.TOLERANCE = 0.48  # 0.225
 
-        # stream object
-        self.pa = pyaudio.PyAudio()
+        # stream object, only initialized for live audio sources
+        self._pa = None
+
+        # tone detector
+        if detector == 'fft':
+            self._detector = Stft(self.CHUNK, self.HOP)
+        elif detector == 'goertzel':
+            self._detector = Goertzel(self.CHUNK, self.HOP, self.RATE)
+        else:
+            raise ValueError("Unknown tone detector '%s'" % detector)
+
+        # noise reduction in between the raw audio and the tone detector
+        self._denoiser = Denoiser(rate=self.RATE) if denoise else None
+
+    @property
+    def pa(self):
+        """
+        Initializes PyAudio on first use, so that decoding files does not need an audio device.
+        :return: The PyAudio object
+        """
+        if self._pa is None:
+            import pyaudio
+            self._pa = pyaudio.PyAudio()
+        return self._pa
+
+    def close(self) -> None:
+        """
+        Terminates PyAudio if it has been initialized.
+        """
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
 
     def _read_waveaudio(self, file):
         """
-        Reads in the given wave file and returns a new PyAudio stream object from it.
+        Maps the given wave file into memory.
         :param file: The path to the file to read in
-        :return (waveform, stream): (The actual audio data as a waveform, the PyAudio object for said data)
+        :return: The actual audio data as a memory-mapped waveform
         """
 
         # Open the waveform from the command argument
         try:
-            waveform = wave.open(file, 'rb')
+            waveform = WaveFile(file)
         except wave.Error:
             print('The program can only process wave audio files (.wav)')
             sys.exit()
@@ -51,227 +95,147 @@ class Input:
             print('The chosen file does not exist')
             sys.exit()
 
-        print("Sample width: %d" % waveform.getsampwidth())
-        print("Format: %d" % self.pa.get_format_from_width(waveform.getsampwidth()))
-        print("Channels: %d" % waveform.getnchannels())
-        print("Framerate: %d" % waveform.getframerate())
-
-        # Load PyAudio and create a useable waveform object
-        self.stream = self.pa.open(
-            format=self.pa.get_format_from_width(waveform.getsampwidth()),
-            channels=waveform.getnchannels(),
-            rate=waveform.getframerate(),
-            input=True,
-            output=False,
-            frames_per_buffer=self.CHUNK,
-        )
-
-        # self.stream = self.pa.open(
-        #     format=self.FORMAT,
-        #     channels=self.CHANNELS,
-        #     rate=self.RATE,
-        #     input=True,
-        #     output=True,
-        #     frames_per_buffer=self.CHUNK,
-        # )
-
-        # Return the waveform as well as the generated PyAudio stream object
-        return waveform  # , stream
-
-    def _export(self, tuples: list) -> str:
-        filename = 'waveaudio_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.csv'
-        print(" - Writing read audio wave data to '%s'." % filename)
-
-        with open(filename, 'w', newline='') as csv_file:
-            writer = csv.writer(csv_file, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(['endtime'] + ['loudness'])
+        metrics.annotate(format=waveform.format, sample_width=waveform.sampwidth, channels=waveform.channels,
+                         framerate=waveform.framerate)
 
-            for endtime, loudness in tuples:
-                writer.writerow([round(endtime, 4)] + [round(loudness, 4)])
-        return filename
+        return waveform
 
-    def _plot_wave(self, amplitudes):
-
-        # Find out max value for normalization
-        maxPCM = 0
-        for pcmMax in np.abs(amplitudes):
-            if pcmMax is not np.nan and pcmMax > maxPCM:
-                maxPCM = pcmMax
-
-        counter = 1
-        previous = 0.0
-        x = list()
-        y = list()
-        average = [0.0]
-
-        for pcmMax in np.array(amplitudes):
-
-            normalized = abs(pcmMax / maxPCM)
-
-            if abs(normalized - previous) > self.TOLERANCE:
+    def _export(self, endtimes: np.ndarray, loudness: np.ndarray, filename: str, source: str = None) -> str:
+        print(" - Writing read audio wave data to '%s'." % filename)
 
-                # Signal has changed
-                if previous < 0.4 and normalized > 0.6:
-                    y.append(np.min(average))
-                elif previous > 0.6 and normalized < 0.4:
-                    y.append(np.max(average))
-                else:
-                    y.append(np.mean(average))
-                x.append(counter)
-                average.clear()
+        if filename.lower().endswith('.csv'):
+            return series.write_csv(filename, endtimes, loudness)
+        return series.write(filename, endtimes, loudness, self.RATE, self.CHUNK, source)
 
-            average.append(normalized)
-            previous = normalized
-            counter += 1
+    def _plot_wave(self, amplitudes):
 
-        print("Length amplitudes: %d, Length y: %d, Max amplitude: %f" % (len(amplitudes), len(y), maxPCM))
+        x, y = segment(amplitudes, self.TOLERANCE)
 
-        # absys = np.abs(amplitudes)
-        # print(len(absys))
-        # print("#############################################")
-        # for p, absy in zip(y, absys):
-        #    print('p: %f, abs: %f' % (p, absy))
-        # print("#############################################")
+        metrics.annotate(items=len(y))
 
         # Display the plotted graph
-        fig = plt.figure(figsize=(25, 5))
-        ax = fig.add_subplot(111)
-        ax.plot(x, y, 'b')
-        plt.show()
+        if self.plot:
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=(25, 5))
+            ax = fig.add_subplot(111)
+            ax.plot(x, y, 'b')
+            plt.show()
 
-        return list(zip(x, y))
+        return x, y
 
-    def read_file(self, filename: str) -> list:
+    def _analyse_blocks(self, waveform: WaveFile, size: int = 1 << 18) -> tuple:
+        """
+        Analyses a wave file of any format block by block at the working rate, denoised if configured.
+        :param waveform: The wave file
+        :param size: Number of sample frames that are read at once
+        :return: (samples, maxima, minima, count) with the converted samples (only kept for plots), the maxima and
+                 minima of every frame and the number of converted samples
+        """
+        maxima, minima, kept = list(), list(), list()
+        pending = np.empty(0)
+        count = 0
+
+        for block in waveform.blocks(size, self.RATE):
+            if self._denoiser is not None:
+                block = self._denoiser.process_chunk(block)
+            count += len(block)
+            if self.plot:
+                kept.append(block)
+
+            # Frames may span two blocks, the samples of an incomplete frame are carried over
+            pending = np.concatenate((pending, block))
+            metrics.annotate(buffer=len(pending))
+            block_maxima, block_minima = self._detector.band_extrema(pending, partial=False)
+            pending = pending[len(block_maxima) * self.HOP:]
+            maxima.append(block_maxima)
+            minima.append(block_minima)
+
+        # The remaining samples form the trailing partial frame
+        if len(pending) > 0 and self._detector.frame_count(count) > sum(len(block) for block in maxima):
+            block_maxima, block_minima = self._detector.band_extrema(pending)
+            maxima.append(block_maxima[:1])
+            minima.append(block_minima[:1])
+
+        samples = np.concatenate(kept) if kept else np.empty(0)
+        return samples, np.concatenate(maxima or [np.empty(0)]), np.concatenate(minima or [np.empty(0)]), count
+
+    def read_file(self, filename: str, export: str = None) -> tuple:
         """
         Reads a sound file and extracts data.
-        :param filename:
-        :return:
+        :param filename: The path to the wave file
+        :param export: Optional path of a file to which the extracted data is written as well, a CSV file if its name
+                       ends with '.csv' and a binary series file otherwise
+        :return: (endtimes, loudness) as arrays with the end time in seconds and the loudness of every signal
         """
         print("Opening sound file '%s' ..." % filename)
 
         # Read in the given file
-        # (waveform, stream) = self._read_waveaudio(filename)
-
         waveform = self._read_waveaudio(filename)
-        fmt = self.pa.get_format_from_width(waveform.getsampwidth())
-
-        originals = list()
-        fouriers = list()
-
-        # Counting the iterations of the while-loop
-        iteration = 0
 
-        # Read a first chunk and continue to do so for as long as there is a stream to read in
-        original = waveform.readframes(self.CHUNK)
-
-        threshold = 0.0
-
-        while original != b'':
-
-            try:
-                # Read byte array as signed 16 bit PCM data
-                _bytes = np.frombuffer(original, dtype=np.int16)
-                originals.extend(_bytes)
-
-                # Read as floats
-                # if len(original) % 4 == 0:
-                #    format = int(len(original) / 4) * 'f'
-                #    unpacked = struct.unpack(format, original)
-
-                # try:
-                #    data_int = struct.unpack(str(2 * self.CHUNK) + 'B', original)
-                # except struct.error:
-                #    break
-
-                _fft = fft(_bytes)
-                # Reduce FFT to relevant values (exclude edge cases)
-                lower_bound: int = 10
-                upper_bound: int = round(0.45 * len(_fft))
-                fourier = (np.abs(_fft[0:self.CHUNK]) / (128 * self.CHUNK))[lower_bound:upper_bound]
-
-                if len(fourier) > 0:
-                    fourier_max = np.max(fourier)
-                    fourier_min = np.min(fourier)
-
-                    # Set threshold to 50%
-                    if fourier_max > 2 * threshold:
-                        threshold = fourier_max / 2
-
-                    if fourier_max > threshold:  # self.THRESHOLD_FOURIER:
-                        fouriers.append(fourier_max)
-                    else:
-                        fouriers.append(fourier_min)
-
-                ##################################################################################
-
-                # print(fourier)
-                # print(np.abs(fourier[0:self.CHUNK]) / (128 * self.CHUNK))
-
-                # fig = plt.figure(figsize=(7, 4))
-                # ax = fig.add_subplot(111)
-                # xf = np.linspace(0, self.RATE, self.CHUNK)
-                # line_fft, = ax.semilogx(xf, np.random.rand(self.CHUNK), '-', lw=2)
-
-                # line_fft.set_ydata((np.abs(fourier[0:self.CHUNK]) / (128 * self.CHUNK)))
-                # plt.show()
-
-                # print(np.max((np.abs(fourier[0:self.CHUNK]) / (128 * self.CHUNK))))
-
-                # originals.extend(np.array(data_int, dtype='b')[::2] + 128)
-
-                ##################################################################################
-
-                # Read in the next chunk of data
-                original = waveform.readframes(self.CHUNK)
-
-                # Add up one to the iterations
-                iteration += 1
-
-            except (KeyboardInterrupt, SystemExit):
-                break
-
-        # Stop the stream after there is no more data to read
-        self.stream.stop_stream()
-        self.stream.close()
+        self._detector.reset()
+        if self._denoiser is not None:
+            self._denoiser.reset()
+
+        native = (waveform.format, waveform.sampwidth, waveform.channels, waveform.framerate) == \
+            (WAVE_FORMAT_PCM, 2, 1, self.RATE)
+        if native and self._denoiser is None:
+            # Signed 16 bit PCM data at the working rate, framed directly from the memory-mapped file
+            samples = waveform.samples
+            maxima, minima = self._detector.band_extrema(samples)
+            count = len(samples)
+            metrics.annotate(buffer=len(samples))
+        else:
+            # Any other format (or audio that is denoised) is converted, down-mixed and resampled to the working
+            # rate block by block
+            samples, maxima, minima, count = self._analyse_blocks(waveform)
+
+        # Keep the loudest part of the spectrum if it is loud enough
+        fouriers, _ = gate(maxima, minima)
+        iteration = self._detector.frame_count(count)
 
         # Plot input stream and derived max/min FFT
-        _, (ax1, ax2) = plt.subplots(2, figsize=(20, 6))
-        ax1.plot(originals, 'g')
-        ax2.plot(fouriers, 'r')
-        plt.show()
+        if self.plot:
+            import matplotlib.pyplot as plt
+            _, (ax1, ax2) = plt.subplots(2, figsize=(20, 6))
+            ax1.plot(samples, 'g')
+            ax2.plot(fouriers, 'r')
+            plt.show()
 
-        # Terminate PyAudio as well as the program
-        self.pa.terminate()
+        x, y = self._plot_wave(fouriers)
 
-        # sys.exit()
+        seconds = (iteration * self.HOP) / self.RATE
+        metrics.annotate(frames=iteration, duration=seconds)
 
-        tuples = self._plot_wave(fouriers)
-
-        samplewidth = waveform.getsampwidth()
-        framerate = int(waveform.getframerate())
-
-        seconds = (iteration * samplewidth * self.CHUNK) / (2 * framerate)
-        print("Estimated duration (s): %f" % seconds)
-
-        # print("LENGTHS: iterations: %d, originals: %d, fouriers: %d, tuples: %d" % (iteration, len(originals), len(fouriers), len(tuples)))
+        # print("LENGTHS: iterations: %d, samples: %d, fouriers: %d, tuples: %d" % (iteration, len(samples), len(fouriers), len(y)))
 
         # Transform time unit to seconds
         factor = seconds / iteration
-        tuples_in_seconds = list()
-        for endtime, loudness in tuples:
-            tuples_in_seconds.append((factor * endtime, loudness))
+        endtimes = factor * x
 
         # TODO: Normalize durations to ~12 WPM
 
-        # Return filename of the exported file
-        return self._export(tuples_in_seconds)
+        if export is not None:
+            self._export(endtimes, y, export, filename)
 
+        return endtimes, y
 
-def record_microphone(self, resolution: int) -> None:
-    print(resolution)
-    pass
+    def record_microphone(self, duration: float = None, wpm: int = 12, window: int = 32):
+        """
+        Decodes the default input device live and prints the characters as soon as they are complete.
+        :param duration: Maximum duration of the recording in seconds, unlimited if not set
+        :param wpm: Expected speed as defined by 'words per minute'
+        :param window: Number of latest marks the speed is tracked over, 0 keeps the expected speed
+        """
+        stream = StreamDecoder(None, self.RATE, self.CHUNK, self.HOP, self.TOLERANCE, wpm, window)
+        live = LiveDecoder(Microphone(self.pa, self.RATE, self.CHUNK), stream)
+        try:
+            live.run(duration, lambda characters: print(characters, end='', flush=True))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
 
 
 if __name__ == "__main__":
-    _input = Input()
+    _input = Input(plot=True)
     _input.read_file('testfile.wav')
@@ -0,0 +1,343 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from decoder import Decoder
+from stft import Stft
+from stream import Envelope, Runs, Signals
+from timing import SpeedTracker
+from wavfile import WaveFile
+
+# Status flags of PortAudio's stream callback
+INPUT_UNDERFLOW = 1
+INPUT_OVERFLOW = 2
+
+
+class RingBuffer:
+    """
+    A lock-free ring buffer for audio samples with exactly one producer and one consumer thread.
+    """
+
+    def __init__(self, capacity: int, dtype=np.int16):
+        """
+        Allocates the buffer.
+        :param capacity: The maximum number of buffered samples
+        :param dtype: The type of the samples
+        """
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=dtype)
+
+        # Both counters only ever grow and each of them is only written by one side
+        self._written = 0
+        self._read = 0
+
+        self.overruns = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._written - self._read
+
+    def write(self, samples: np.ndarray) -> int:
+        """
+        Appends samples to the buffer, samples that do not fit anymore are dropped.
+        :param samples: The samples to append
+        :return: The number of samples that were written
+        """
+        free = self.capacity - (self._written - self._read)
+        if len(samples) > free:
+            self.overruns += 1
+            self.dropped += len(samples) - free
+            samples = samples[:free]
+
+        start = self._written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._buffer[start:start + first] = samples[:first]
+        self._buffer[:len(samples) - first] = samples[first:]
+
+        # Publish the samples only after they have been copied
+        self._written += len(samples)
+        return len(samples)
+
+    def read(self, maximum: int = None) -> np.ndarray:
+        """
+        Takes the oldest samples out of the buffer.
+        :param maximum: The maximum number of samples to take, all available samples if not set
+        :return: A copy of the samples
+        """
+        count = self._written - self._read
+        if maximum is not None:
+            count = min(count, maximum)
+
+        start = self._read % self.capacity
+        first = min(count, self.capacity - start)
+        samples = np.concatenate((self._buffer[start:start + first], self._buffer[:count - first]))
+
+        self._read += count
+        return samples
+
+
+class Microphone:
+    """
+    A live audio source that captures the default (or the given) input device in PyAudio's callback mode.
+    """
+
+    def __init__(self, pa, rate: int = 8000, chunk: int = 256, device: int = None):
+        """
+        Configures the source.
+        :param pa: The PyAudio object
+        :param rate: The sample rate
+        :param chunk: Number of samples per callback
+        :param device: Index of the input device, the default device if not set
+        """
+        self.rate = rate
+        self.chunk = chunk
+        self._pa = pa
+        self._device = device
+        self._stream = None
+
+    @property
+    def running(self) -> bool:
+        return self._stream is not None and self._stream.is_active()
+
+    def start(self, callback) -> None:
+        """
+        Starts capturing.
+        :param callback: Receives every captured chunk of signed 16 bit samples as well as PortAudio's status flags
+        """
+        import pyaudio
+
+        def _callback(in_data, frame_count, time_info, status):
+            callback(np.frombuffer(in_data, dtype=np.int16), status)
+            return None, pyaudio.paContinue
+
+        self._stream = self._pa.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            input=True,
+            output=False,
+            frames_per_buffer=self.chunk,
+            input_device_index=self._device,
+            stream_callback=_callback,
+        )
+        self._stream.start_stream()
+
+    def stop(self) -> None:
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+
+class WaveReplay:
+    """
+    A fake live audio source that replays a wave file at real-time pace, e.g. for testing.
+    """
+
+    def __init__(self, filename: str, chunk: int = 256, speed: float = 1.0, rate: int = 8000):
+        """
+        Configures the source.
+        :param filename: The path to the wave file
+        :param chunk: Number of samples per callback
+        :param speed: Factor by which the replay is faster than real time
+        :param rate: The sample rate the file is resampled to
+        """
+        self._waveform = WaveFile(filename)
+        self.rate = rate
+        self.chunk = chunk
+        self.speed = speed
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, callback) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._replay, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _replay(self, callback) -> None:
+        begin = time.monotonic()
+        replayed = 0
+        for block in self._waveform.blocks(rate=self.rate):
+            samples = np.clip(np.round(block), -32768, 32767).astype(np.int16)
+            for offset in range(0, len(samples), self.chunk):
+                chunk = samples[offset:offset + self.chunk]
+                replayed += len(chunk)
+                due = begin + replayed / (self.rate * self.speed)
+                if self._stop.wait(max(due - time.monotonic(), 0)):
+                    return
+                callback(chunk, 0)
+
+
+class StreamDecoder:
+    """
+    Decodes a stream of audio samples incrementally and returns the characters as soon as they are complete. It pushes
+    the samples through the same stages as the generators of the stream module.
+    """
+
+    def __init__(self, logger: logging.Logger = None, rate: int = 8000, frame_size: int = 256, hop: int = None,
+                 tolerance: float = 0.48, wpm: int = 12, window: int = 32, lead: int = 64):
+        """
+        Configures the stream decoder.
+        :param logger: The logger of the decoder
+        :param rate: The sample rate of the stream
+        :param frame_size: Number of samples per analysed frame
+        :param hop: Number of samples between the starts of two frames (defaults to the frame size)
+        :param tolerance: Loudness area in which the signal is thought to be the same
+        :param wpm: Expected speed as defined by 'words per minute'
+        :param window: Number of latest marks the speed is tracked over, 0 keeps the expected speed
+        :param lead: Number of frames that are collected before the first runs are split, see stream.Runs
+        """
+        self._text = list()
+        self.decoder = Decoder(logger or logging.getLogger('decoder'), self._text.append)
+        self.tracker = SpeedTracker(1.2 / wpm, window)
+
+        detector = Stft(frame_size, hop)
+        self._envelope = Envelope(detector)
+        self._runs = Runs(tolerance, lead)
+        self._signals = Signals(detector.hop / rate, self.tracker)
+
+        # Number of characters that have been passed on
+        self.count = 0
+
+    def feed(self, samples: np.ndarray) -> str:
+        """
+        Processes the next samples of the stream.
+        :param samples: Signed 16 bit samples
+        :return: The characters that have been completed by these samples
+        """
+        signals = self._signals.push(self._runs.push(self._envelope.push(samples)))
+
+        # A long pause completes the character without waiting for the next mark
+        signals.extend(self._signals.flush(*self._runs.open))
+        return self._decode(signals)
+
+    def finish(self) -> str:
+        """
+        Ends the stream and completes the last character.
+        :return: The characters that have been completed
+        """
+        runs = self._runs.push(self._envelope.finish()) + self._runs.finish()
+        return self._decode(self._signals.push(runs) + self._signals.finish())
+
+    def _decode(self, signals: list) -> str:
+        for signal in signals:
+            self.decoder.decode(signal)
+
+        characters = ''.join(self._text)
+        self._text.clear()
+        self.count += len(characters)
+
+        # The characters are passed on, the decoder does not need to keep them
+        self.decoder.message = ''
+        return characters
+
+
+class LiveDecoder:
+    """
+    Decodes a live audio source: the source fills a ring buffer from its callback while a consumer decodes it.
+    """
+
+    def __init__(self, source, stream: StreamDecoder, buffer: float = 10.0):
+        """
+        Configures the live decoder.
+        :param source: A live audio source, e.g. a Microphone or a WaveReplay
+        :param stream: The stream decoder that consumes the samples
+        :param buffer: Capacity of the ring buffer in seconds
+        """
+        self.source = source
+        self.stream = stream
+        self.ring = RingBuffer(int(buffer * source.rate))
+
+        self.underflows = 0
+        self.overflows = 0
+        self.underruns = 0
+
+        self._captured = 0.0
+        self._latency_count = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+
+    def _capture(self, samples: np.ndarray, status: int) -> None:
+        if status & INPUT_UNDERFLOW:
+            self.underflows += 1
+        if status & INPUT_OVERFLOW:
+            self.overflows += 1
+        self.ring.write(samples)
+        self._captured = time.monotonic()
+
+    def run(self, duration: float = None, on_characters=None) -> str:
+        """
+        Decodes the source until it stops or the given duration has passed.
+        :param duration: Maximum duration in seconds, unlimited if not set
+        :param on_characters: Called with every group of completed characters, which are not kept then
+        :return: The decoded characters unless they are passed to on_characters
+        """
+        period = self.source.chunk / self.source.rate
+        deadline = None if duration is None else time.monotonic() + duration
+        characters = list()
+
+        self.source.start(self._capture)
+        last_data = time.monotonic()
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                captured = self._captured
+                samples = self.ring.read()
+
+                if len(samples) == 0:
+                    if not self.source.running:
+                        break
+                    if time.monotonic() - last_data > 2 * period:
+                        self.underruns += 1
+                        last_data = time.monotonic()
+                    time.sleep(period / 2)
+                    continue
+
+                last_data = time.monotonic()
+                decoded = self.stream.feed(samples)
+                if decoded:
+                    self._measure(captured)
+                    if on_characters is not None:
+                        on_characters(decoded)
+                    else:
+                        characters.append(decoded)
+        finally:
+            self.source.stop()
+
+        decoded = self.stream.finish()
+        if decoded and on_characters is not None:
+            on_characters(decoded)
+        elif decoded:
+            characters.append(decoded)
+        return ''.join(characters)
+
+    def _measure(self, captured: float) -> None:
+        latency = time.monotonic() - captured
+        self._latency_count += 1
+        self._latency_sum += latency
+        self._latency_max = max(self._latency_max, latency)
+
+    def stats(self) -> dict:
+        """
+        :return: Latency between the capture of a chunk and the output of the characters it completed, as well as
+                 the counters of buffer overruns and underruns
+        """
+        return {
+            'latency_mean': self._latency_sum / self._latency_count if self._latency_count else 0.0,
+            'latency_max': self._latency_max,
+            'overruns': self.ring.overruns,
+            'dropped': self.ring.dropped,
+            'underruns': self.underruns,
+            'input_overflows': self.overflows,
+            'input_underflows': self.underflows,
+        }
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Counters of a record that are passed to annotate as keywords, every other keyword becomes a detail
+COUNTERS = ('items', 'frames', 'symbols')
+
+
+class Record:
+    """
+    The measurements of a single run of a pipeline stage.
+    """
+    __slots__ = ('name', 'seconds', 'items', 'frames', 'symbols', 'buffer', 'details')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.items = 0
+        self.frames = 0
+        self.symbols = 0
+        self.buffer = 0
+        self.details = None
+
+    def rate(self, count: int) -> float:
+        """
+        :param count: A number of processed units
+        :return: The number of units processed per second
+        """
+        return count / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {'stage': self.name, 'seconds': self.seconds, 'items': self.items, 'frames': self.frames,
+                'symbols': self.symbols, 'frames_per_second': self.rate(self.frames),
+                'symbols_per_second': self.rate(self.symbols), 'buffer': self.buffer, 'details': self.details or {}}
+
+
+class Metrics:
+    """
+    Measures the pipeline stages and hands the records to the registered sinks. Without any sink, only the wall time
+    of the stages is measured and annotations are ignored.
+    """
+
+    def __init__(self):
+        self._sinks = list()
+        self._current = ContextVar('record', default=None)
+
+        # Time measured by measure() in this thread, a measured iterable that draws from another one subtracts it
+        self._nested = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._sinks)
+
+    def register(self, sink) -> None:
+        """
+        Adds a sink, which receives every completed record by its 'emit' method.
+        :param sink: The sink
+        """
+        self._sinks = self._sinks + [sink]
+
+    def unregister(self, sink) -> None:
+        self._sinks = [registered for registered in self._sinks if registered is not sink]
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the enclosed block as one run of the given stage.
+        :param name: The name of the stage
+        :return: The record of the run, whose counters may be set within the block
+        """
+        record = Record(name)
+        sinks = self._sinks
+        token = self._current.set(record) if sinks else None
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            if token is not None:
+                self._current.reset(token)
+                for sink in sinks:
+                    sink.emit(record)
+
+    def measure(self, name: str, iterable, counter: str = 'items', size=None):
+        """
+        Measures a stage that passes its results on through an iterable, e.g. a generator within a chain of generators
+        that run interleaved: the time spent in producing the results is summed up and reported as a single run once
+        the iterable ends. The time spent in another measured iterable it draws from is not counted.
+        :param name: The name of the stage
+        :param iterable: The results of the stage
+        :param counter: The counter ('items', 'frames' or 'symbols') that counts the results
+        :param size: Returns the count of a single result, every result counts once if not set
+        :return: A generator of the same results
+        """
+        if not self._sinks:
+            yield from iterable
+            return
+
+        record = Record(name)
+        sinks = self._sinks
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                nested = getattr(self._nested, 'seconds', 0.0)
+                try:
+                    result = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds = time.perf_counter() - start
+                    record.seconds += seconds - (getattr(self._nested, 'seconds', 0.0) - nested)
+                    self._nested.seconds = nested + seconds
+                setattr(record, counter, getattr(record, counter) + (size(result) if size else 1))
+                yield result
+        finally:
+            for sink in sinks:
+                sink.emit(record)
+
+    def annotate(self, **values) -> None:
+        """
+        Adds counters ('items', 'frames' and 'symbols'), the peak buffer size ('buffer') or any other details to the
+        record of the innermost stage that is running.
+        """
+        record = self._current.get()
+        if record is None:
+            return
+        for key, value in values.items():
+            if key in COUNTERS:
+                setattr(record, key, getattr(record, key) + value)
+            elif key == 'buffer':
+                record.buffer = max(record.buffer, value)
+            else:
+                if record.details is None:
+                    record.details = dict()
+                record.details[key] = value
+
+
+class LoggingSink:
+    """
+    Logs every record.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self._logger = logger or logging.getLogger('metrics')
+        self._level = level
+
+    def emit(self, record: Record) -> None:
+        details = ''.join(', %s: %s' % (key, value) for key, value in (record.details or {}).items())
+        self._logger.log(self._level, "%s: %.4f s, %d items, %d frames (%.0f/s), %d symbols (%.0f/s), buffer %d%s",
+                         record.name, record.seconds, record.items, record.frames, record.rate(record.frames),
+                         record.symbols, record.rate(record.symbols), record.buffer, details)
+
+
+class MemorySink:
+    """
+    Keeps every record, e.g. for tests.
+    """
+
+    def __init__(self):
+        self.records = list()
+
+    def emit(self, record: Record) -> None:
+        self.records.append(record)
+
+    def find(self, name: str) -> list:
+        """
+        :param name: The name of a stage
+        :return: All records of the stage
+        """
+        return [record for record in self.records if record.name == name]
+
+
+class PrometheusSink:
+    """
+    Sums up the records per stage and keeps them in a file in the text format of Prometheus, e.g. for the textfile
+    collector of the node exporter.
+    """
+
+    METRICS = (
+        ('runs_total', 'counter', 'Number of runs of the stage'),
+        ('seconds_total', 'counter', 'Wall time spent in the stage'),
+        ('items_total', 'counter', 'Items processed by the stage'),
+        ('frames_total', 'counter', 'Audio frames processed by the stage'),
+        ('symbols_total', 'counter', 'Symbols processed by the stage'),
+        ('buffer_peak', 'gauge', 'Largest buffer of the stage'),
+    )
+
+    def __init__(self, filename: str, prefix: str = 'morsecode_stage'):
+        """
+        :param filename: The path to the file, which is replaced after every record
+        :param prefix: Prefix of the metric names
+        """
+        self.filename = filename
+        self.prefix = prefix
+        self._totals = dict()
+        self._lock = threading.Lock()
+
+    def emit(self, record: Record) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(record.name, dict.fromkeys((name for name, _, _ in self.METRICS), 0))
+            totals['runs_total'] += 1
+            totals['seconds_total'] += record.seconds
+            totals['items_total'] += record.items
+            totals['frames_total'] += record.frames
+            totals['symbols_total'] += record.symbols
+            totals['buffer_peak'] = max(totals['buffer_peak'], record.buffer)
+            self._write()
+
+    def _write(self) -> None:
+        lines = list()
+        for metric, kind, description in self.METRICS:
+            name = '%s_%s' % (self.prefix, metric)
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for stage, totals in sorted(self._totals.items()):
+                lines.append('%s{stage="%s"} %s' % (name, stage, totals[metric]))
+
+        # Scrapers must never see a partially written file
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self.filename)
+
+
+# The metrics of this process
+_metrics = Metrics()
+register = _metrics.register
+unregister = _metrics.unregister
+stage = _metrics.stage
+measure = _metrics.measure
+annotate = _metrics.annotate
+
+
+def enabled() -> bool:
+    """
+    :return: Whether any sink is registered
+    """
+    return _metrics.enabled
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+
+import metrics
+import stream
+from channelizer import Channelizer
+from clustering import Clustering
+from decoder import decode_labels
+from denoiser import Denoiser
+from goertzel import Goertzel
+from input import Input
+from preprocessor import Preprocessor
+from stft import Stft
+from timing import AdaptiveClassifier, SpeedTracker, TimingClassifier
+from wavfile import WaveFile
+
+# Classifiers of the signals by name
+CLASSIFIERS = {'kmeans': Clustering, 'timing': TimingClassifier, 'adaptive': AdaptiveClassifier}
+
+
+def _classifier(name: str, plot: bool = False):
+    """
+    Creates an untrained classifier.
+    :param name: The name of the classifier
+    :param plot: Should the classified signals be displayed?
+    :return: The classifier
+    """
+    if name not in CLASSIFIERS:
+        raise ValueError("Unknown classifier '%s'" % name)
+    return Clustering(5, plot) if name == 'kmeans' else CLASSIFIERS[name](plot)
+
+
+def decode(filename: str, plot: bool = False, detector: str = 'fft', export: str = None, model: str = None,
+           refine: float = None, timings: dict = None, classifier: str = 'kmeans', denoise: bool = False) -> str:
+    """
+    Runs the whole pipeline for a single wave file.
+    :param filename: The path to the wave file
+    :param plot: Should diagnostic plots be displayed in between the steps?
+    :param detector: The tone detector of the input, either 'fft' or 'goertzel'
+    :param export: Optional path of a file to which the data extracted from the audio is written (CSV or binary)
+    :param model: Optional path of a stored clustering model, which is used instead of training a new one.
+                  If the file does not exist yet, the newly trained model is stored there.
+    :param refine: Refine a loaded model if its fit gets worse than this multiple of the training fit
+    :param timings: Optional dictionary that receives the duration of every step in seconds
+    :param classifier: Either 'kmeans' (clustering), 'timing' (estimates the 1:3:7 timing, much faster) or
+                       'adaptive' (like 'timing', but follows changes of the speed)
+    :param denoise: Should the audio be band-pass filtered around the tone and gated before the tone detection?
+    :return: The decoded message
+    """
+    if classifier not in CLASSIFIERS:
+        raise ValueError("Unknown classifier '%s'" % classifier)
+    if timings is None:
+        timings = dict()
+
+    # Set up components
+    preprocessor = Preprocessor()
+
+    with metrics.stage('input') as record:
+        _input = Input(detector=detector, plot=plot, denoise=denoise)
+        endtimes, loudness = _input.read_file(filename, export)
+    timings['input'] = record.seconds
+
+    with metrics.stage('preprocessing') as record:
+        preprocessor.read_series(endtimes, loudness)
+        if plot:
+            preprocessor.plot()
+            preprocessor.plot(True)
+
+        preprocessor.process_loudness()
+        if plot:
+            preprocessor.plot()
+            preprocessor.plot(True)
+
+        training_batch = preprocessor.get_batch()
+    timings['preprocessing'] = record.seconds
+
+    with metrics.stage('clustering') as record:
+        if model is not None and os.path.exists(model):
+            clustering = CLASSIFIERS[classifier].load(model, plot)
+            labels = clustering.classify(training_batch, refine)
+        else:
+            clustering = _classifier(classifier, plot)
+            labels = clustering.train(training_batch)
+            if model is not None:
+                clustering.save(model)
+        mapping = clustering.get_label_mapping()
+    timings['clustering'] = record.seconds
+
+    with metrics.stage('decoding') as record:
+        message = decode_labels(labels, mapping)
+    timings['decoding'] = record.seconds
+    return message
+
+
+def decode_channels(filename: str, channels: int = 4, classifier: str = 'timing') -> list:
+    """
+    Decodes every station within a single wave file that keys a tone of its own.
+    :param filename: The path to the wave file
+    :param channels: The maximum number of tones that are decoded
+    :param classifier: The classifier of the signals of every tone, see decode
+    :return: A list of (frequency, message) for every detected tone, strongest tone first
+    """
+    _classifier(classifier)
+    with metrics.stage('channels'):
+        waveform = WaveFile(filename)
+        channelizer = Channelizer(channels=channels)
+        samples = np.concatenate([np.empty(0)] + list(waveform.blocks(rate=channelizer.rate)))
+        return channelizer.decode(samples, lambda: _classifier(classifier))
+
+
+def decode_stream(filename: str, detector: str = 'fft', denoise: bool = False, wpm: int = 12, window: int = 32,
+                  block: int = 1 << 14, rate: int = 8000, frame_size: int = 256, survey: float = 2.0):
+    """
+    Decodes a wave file of any length with constant memory: the blocks of samples, the loudness of the frames, the
+    runs of marks and spaces, the classified signals and the characters flow through chained generators, so the first
+    characters are returned right after the first blocks have been read.
+    :param filename: The path to the wave file
+    :param detector: The tone detector, either 'fft' or 'goertzel'
+    :param denoise: Should the audio be band-pass filtered around the tone and gated before the tone detection?
+    :param wpm: Expected speed as defined by 'words per minute', the speed is tracked from there
+    :param window: Number of latest marks the speed is tracked over, 0 keeps the expected speed
+    :param block: Number of sample frames that are read at once
+    :param rate: The sample rate the audio is decoded at
+    :param frame_size: Number of samples per analysed frame
+    :param survey: Duration in seconds at the beginning of the recording that is used to find the tone
+    :return: A generator of the decoded text, in pieces as soon as they are complete
+    """
+    if detector == 'fft':
+        _detector = Stft(frame_size)
+    elif detector == 'goertzel':
+        _detector = Goertzel(frame_size, rate=rate, survey=survey)
+    else:
+        raise ValueError("Unknown tone detector '%s'" % detector)
+    denoiser = Denoiser(rate=rate, wpm=wpm) if denoise else None
+
+    # Every stage is measured on its own, the time it waits for the results of the previous one is not counted
+    waveform = WaveFile(filename)
+    blocks = metrics.measure('input', waveform.blocks(block, rate), 'frames', len)
+    loudness = metrics.measure('envelope', stream.envelopes(blocks, _detector, denoiser, int(survey * rate)),
+                               'frames', len)
+    segments = metrics.measure('segmentation', stream.runs(loudness))
+    signals = metrics.measure('classification', stream.signals(segments, _detector.hop / rate,
+                                                               SpeedTracker(1.2 / wpm, window)), 'symbols')
+    return metrics.measure('decoding', stream.characters(signals), 'items', len)
@@ -1,7 +1,7 @@
-import csv
-import math
+import numpy as np
 
-import matplotlib.pyplot as plt
+import metrics
+from series import SeriesFile, read_csv
 
 
 class Preprocessor:
@@ -9,107 +9,114 @@ class Preprocessor:
     A preprocessor for stored sound file information.
     """
 
-    _duration_list: list = list()
-    _loudness_list: list = list()
+    # Duration and loudness of every signal as well as the end time of the last one, owned by each instance
+    _durations: np.ndarray
+    _loudness: np.ndarray
+    _endtime: float
 
-    _duration_max: float = 0.0
-    _duration_min: float = 999999.99
+    _duration_max: float
+    _duration_min: float
+
+    def __init__(self):
+        self._durations = np.empty(0)
+        self._loudness = np.empty(0)
+        self._endtime = 0.0
+
+        self._duration_max = 0.0
+        self._duration_min = 999999.99
 
     def read_csv(self, filename: str):
         """
         Reads the contents of a given CSV file
         :param filename: File name of the CSV file
         """
+        self.read_series(*read_csv(filename))
 
-        with open(filename, newline='') as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                self._duration_list.append(float(row['endtime']))
-                self._loudness_list.append(float(row['loudness']))
-            self._process_duration()
+    def read_binary(self, filename: str):
+        """
+        Reads the contents of a given binary series file, e.g. as exported by the input.
+        :param filename: File name of the series file
+        """
+        data = SeriesFile(filename)
+        self.read_series(data.endtimes, data.loudness)
 
-    def process_loudness(self):
+    def read_series(self, endtimes, loudness):
         """
-        Normalizes the internal list to prepare the data for clustering.
+        Reads the given series of signals, e.g. as returned by the input. Further series continue the previous ones.
+        :param endtimes: The end time of every signal in seconds
+        :param loudness: The loudness of every signal
         """
-        # print(self._loudness_list)
+        endtimes = np.asarray(endtimes, dtype=np.float64)
+        loudness = np.asarray(loudness, dtype=np.float64)
+        if len(endtimes) != len(loudness):
+            raise ValueError("Got %d end times but %d loudness values" % (len(endtimes), len(loudness)))
 
-        loudness_max: float = 0.0
-        loudness_min: float = 999999.99
+        self._process_duration(endtimes)
+        self._loudness = np.concatenate((self._loudness, loudness))
+        metrics.annotate(items=len(endtimes))
 
-        for loudness in self._loudness_list:
-            if loudness > loudness_max:
-                loudness_max = loudness
-            if loudness < loudness_min:
-                loudness_min = loudness
+    def process_loudness(self):
+        """
+        Normalizes the loudness to the range from 0 to 1 to prepare the data for clustering.
+        """
+        if len(self._loudness) == 0:
+            return
+
+        loudness_max = self._loudness.max()
+        loudness_min = self._loudness.min()
 
-        print("\nHI: %.2f, LO: %.2f" % (loudness_max, loudness_min))
-        factor = 1 / (loudness_max - loudness_min)
+        metrics.annotate(loudness_max=float(loudness_max), loudness_min=float(loudness_min))
+        factor = 1 / (loudness_max - loudness_min) if loudness_max > loudness_min else 0.0
 
-        for index, loudness in enumerate(self._loudness_list):
-            self._loudness_list[index] = round((loudness - loudness_min) * factor, 3)
-        # print(self._loudness_list)
+        self._loudness = np.round((self._loudness - loudness_min) * factor, 3)
 
-    def _process_duration(self):
+    def _process_duration(self, endtimes: np.ndarray):
         """
         Changes timestamps to durations to prepare the data for clustering.
+        :param endtimes: The end time of every new signal in seconds
         """
-        # print(self._duration_list)
-        start_time = 0.0
-
-        for index, end_time in enumerate(self._duration_list):
+        if len(endtimes) == 0:
+            return
 
-            duration = round(end_time - start_time, 3)
+        durations = np.round(np.diff(np.concatenate(([self._endtime], endtimes))), 3)
+        self._endtime = endtimes[-1]
 
-            if duration > self._duration_max:
-                self._duration_max = duration
+        self._duration_max = max(self._duration_max, durations.max())
+        self._duration_min = min(self._duration_min, durations.min())
 
-            if duration < self._duration_min:
-                self._duration_min = duration
-
-            #if duration > 1.0:
-            #    self._duration_list[index] = 1.0
-            #else:
-            self._duration_list[index] = duration
-
-            start_time = end_time
-        # print(self._duration_list)
+        self._durations = np.concatenate((self._durations, durations))
 
     def plot(self, series: bool = False):
         """
-        Plots the current state of the internal lists.
+        Plots the current state of the internal arrays.
         :param series: Should the plot be displayed as a time series?
         """
+        import matplotlib.pyplot as plt
 
         if series:
             print("Plotting scatter plot ...")
-            plt.plot(self._duration_list, self._loudness_list, 'bo')
+            plt.plot(self._durations, self._loudness, 'bo')
             plt.axis([self._duration_min - .1, self._duration_max + .1, -.1, 1.1])
         else:
             print("Plotting time series ...")
-            x = list()
-            y = list()
-            start = 0.0
-            for index in range(2 * len(self._duration_list)):
-                if index % 2 == 0:
-                    x.append(start)
-                else:
-                    x.append(start + self._duration_list[math.floor(index / 2)])
-                    start += 0.001 + self._duration_list[math.floor(index / 2)]
-                y.append(self._loudness_list[math.floor(index / 2)])
+
+            # Every signal is drawn from its start to its end, followed by a small gap
+            starts = np.concatenate(([0.0], np.cumsum(self._durations + 0.001)[:-1]))
+            x = np.column_stack((starts, starts + self._durations)).ravel()
+            y = np.repeat(self._loudness, 2)
 
             fig = plt.figure(figsize=(25, 5))
             ax = fig.add_subplot(111)
             ax.plot(x, y, 'bo-')
-            plt.axis([-.1, x[-1] + .1, -.1, 1.1])
+            plt.axis([-.1, (x[-1] if len(x) else 0.0) + .1, -.1, 1.1])
         plt.show()
 
-    def get_batch(self) -> list:
+    def get_batch(self) -> np.ndarray:
         """
-        Returns the processed data as a list of tuples.
-        :return: A list of tuples consisting of duration and loudness
+        Returns the processed data as an array of pairs.
+        :return: An array with the duration and the loudness of every signal
         """
-        return list(zip(self._duration_list, self._loudness_list))
+        return np.column_stack((self._durations, self._loudness))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+class Resampler:
+    """
+    A streaming polyphase resampler for a rational ratio: the anti-aliasing filter is only evaluated at the output
+    samples, so decimating costs a fraction of filtering at the input rate. The filter state is carried across blocks.
+    """
+
+    def __init__(self, rate_in: int, rate_out: int, quality: int = 10, beta: float = 8.0):
+        """
+        Designs the filter.
+        :param rate_in: The sample rate of the input
+        :param rate_out: The sample rate of the output
+        :param quality: Number of zero crossings of the filter on each side (longer filters are steeper)
+        :param beta: Shape parameter of the Kaiser window of the filter
+        """
+        ratio = Fraction(rate_out, rate_in)
+        self.up, self.down = ratio.numerator, ratio.denominator
+
+        # Number of input samples each output sample depends on
+        self.taps = 2 * quality * max(math.ceil(self.down / self.up), 1)
+
+        if self.up == self.down:
+            self._phases = np.ones((1, 1))
+            self.taps = 1
+        else:
+            from scipy.signal import firwin
+            cutoff = 0.95 / max(self.up, self.down)
+            prototype = firwin(self.taps * self.up, cutoff, window=('kaiser', beta)) * self.up
+
+            # Row p holds the coefficients of phase p, reversed to match the order of the input windows
+            self._phases = prototype.reshape(self.taps, self.up).T[:, ::-1].copy()
+
+        # The input is thought to start with silence
+        self._history = np.zeros(self.taps - 1)
+        self._position = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resamples the next block of the stream.
+        :param samples: A 1-D array of samples at the input rate
+        :return: The samples at the output rate that could be completed with this block
+        """
+        if self.up == self.down:
+            return np.asarray(samples, dtype=np.float64)
+
+        signal = np.concatenate((self._history, samples))
+
+        # Output sample n lies at input sample n * down / up, counted from the start of the block
+        available = len(signal) - self.taps + 1
+        count = max(-(-(available * self.up - self._position) // self.down), 0)
+        positions = self._position + np.arange(count) * self.down
+        starts, phases = np.divmod(positions, self.up)
+
+        stride = signal.strides[0]
+        windows = as_strided(signal, shape=(max(available, 0), self.taps), strides=(stride, stride), writeable=False)
+        output = np.einsum('ij,ij->i', windows[starts], self._phases[phases])
+
+        # Keep the samples the next outputs still depend on
+        self._position += count * self.down - len(samples) * self.up
+        self._history = signal[len(samples):]
+        return output
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class Segmenter:
+    """
+    Splits a stream of amplitudes into marks and spaces wherever the normalized amplitude jumps by more than the
+    tolerance. A run that ends with a rising edge is represented by its minimum, a run that ends with a falling edge
+    by its maximum and any other run by its mean.
+    """
+
+    def __init__(self, tolerance: float, peak: float = None):
+        """
+        Configures the segmenter.
+        :param tolerance: Loudness area in which the signal is thought to be the same
+        :param peak: Amplitude used for normalization, the loudest amplitude so far is used if not set
+        """
+        self.tolerance = tolerance
+        self.peak = peak
+
+        # Number of amplitudes seen so far and the frame number at which the last run ended
+        self.count = 0
+        self.edge = 0
+
+        self._running_peak = 0.0
+        self._previous = 0.0
+
+        # Minimum, maximum, sum and length of the open run, the signal is thought to start with silence
+        self._run = (0.0, 0.0, 0.0, 1)
+
+    @property
+    def level(self) -> float:
+        """
+        :return: The normalized amplitude of the last frame
+        """
+        return self._previous
+
+    def prime(self, peak: float) -> None:
+        """
+        Raises the loudest amplitude so far, e.g. to the loudest amplitude of the first frames, so that noise before
+        the first mark is not normalized to full loudness.
+        :param peak: The amplitude
+        """
+        self._running_peak = max(self._running_peak, peak)
+
+    def push(self, amplitudes: np.ndarray) -> tuple:
+        """
+        Processes the next amplitudes of the stream.
+        :param amplitudes: The amplitude of every frame
+        :return: (x, y) as arrays with the frame number at which a run ends and the loudness of every completed run
+        """
+        amplitudes = np.asarray(amplitudes, dtype=np.float64)
+        if len(amplitudes) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Normalize to the loudest amplitude
+        if self.peak is None:
+            peaks = np.maximum.accumulate(np.fmax(np.abs(amplitudes), self._running_peak))
+            self._running_peak = peaks[-1]
+        else:
+            peaks = self.peak
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normalized = np.abs(amplitudes / peaks)
+
+        previous = np.concatenate(([self._previous], normalized[:-1]))
+        edges = np.flatnonzero(np.abs(normalized - previous) > self.tolerance)
+        offset = self.count
+        self.count += len(normalized)
+        self._previous = normalized[-1]
+
+        if len(edges) == 0:
+            self._run = self._merge(self._run, normalized)
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # The first run continues the open run, every other run ends right before the next edge
+        first = self._merge(self._run, normalized[:edges[0]])
+        runs = normalized[edges[0]:edges[-1]]
+        starts = edges[:-1] - edges[0]
+        lengths = np.diff(np.append(starts, len(runs)))
+
+        minima = np.concatenate(([first[0]], np.minimum.reduceat(runs, starts) if len(runs) else []))
+        maxima = np.concatenate(([first[1]], np.maximum.reduceat(runs, starts) if len(runs) else []))
+        means = np.concatenate(([first[2] / first[3]], np.add.reduceat(runs, starts) / lengths if len(runs) else []))
+
+        self._run = self._merge((np.inf, -np.inf, 0.0, 0), normalized[edges[-1]:])
+
+        rising = (previous[edges] < 0.4) & (normalized[edges] > 0.6)
+        falling = (previous[edges] > 0.6) & (normalized[edges] < 0.4)
+
+        y = np.where(rising, minima, np.where(falling, maxima, means))
+        x = offset + edges + 1
+        self.edge = int(x[-1])
+        return x, y
+
+    @staticmethod
+    def _merge(run: tuple, values: np.ndarray) -> tuple:
+        if len(values) == 0:
+            return run
+        return (np.minimum(run[0], values.min()), np.maximum(run[1], values.max()), run[2] + values.sum(),
+                run[3] + len(values))
+
+
+def segment(amplitudes: np.ndarray, tolerance: float) -> tuple:
+    """
+    Splits a whole series of amplitudes into marks and spaces, normalized to the loudest amplitude of the series.
+    :param amplitudes: The amplitude of every frame
+    :param tolerance: Loudness area in which the signal is thought to be the same
+    :return: (x, y) as arrays with the frame number at which a run ends and the loudness of that run
+    """
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    peak = 0.0
+    if len(amplitudes) > 0 and not np.isnan(amplitudes).all():
+        peak = np.nanmax(np.abs(amplitudes))
+    return Segmenter(tolerance, peak).push(amplitudes)
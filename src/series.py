@@ -0,0 +1,169 @@
+import csv
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+# Magic number, version, type codes of the two columns, sample rate, frame size, number of rows and SHA-1 hash of
+# the source file, padded to 64 bytes so that the columns are aligned
+MAGIC = b'MCSERIES'
+VERSION = 1
+HEADER = struct.Struct('<8sH2sIIQ20s16x')
+assert HEADER.size == 64
+
+# Every column starts at a multiple of this number of bytes
+ALIGNMENT = 8
+
+TYPES = {b'f': np.float32, b'd': np.float64}
+CODES = {np.dtype(dtype): code for code, dtype in TYPES.items()}
+
+
+class SeriesFile:
+    """
+    A binary file with the end times and the loudness of a series of signals whose columns are memory-mapped.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Reads the header of the given file and maps its columns.
+        :param filename: The path to the file to read in
+        """
+        self.filename = filename
+
+        with open(filename, 'rb') as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("'%s' is not a series file" % filename)
+
+        _, version, types, self.rate, self.frame_size, count, source = HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError("unsupported series file version: %d" % version)
+        if types[:1] not in TYPES or types[1:] not in TYPES:
+            raise ValueError("unsupported column types: %r" % types)
+
+        # A hash of zeros means that the series does not stem from a file
+        self.source = source.hex() if any(source) else None
+
+        offset = HEADER.size
+        columns = list()
+        for code in (types[:1], types[1:]):
+            dtype = np.dtype(TYPES[code]).newbyteorder('<')
+            if os.path.getsize(filename) < offset + count * dtype.itemsize:
+                raise ValueError("'%s' is truncated" % filename)
+            if count > 0:
+                columns.append(np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(count,)))
+            else:
+                columns.append(np.empty(0, dtype=dtype))
+            offset = _aligned(offset + count * dtype.itemsize)
+
+        self.endtimes, self.loudness = columns
+
+    def __len__(self) -> int:
+        return len(self.endtimes)
+
+
+def _aligned(offset: int) -> int:
+    """
+    :param offset: An offset in bytes
+    :return: The offset rounded up to the next multiple of the alignment
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def digest(filename: str) -> bytes:
+    """
+    Hashes a file without reading it into memory at once.
+    :param filename: The path to the file
+    :return: The SHA-1 hash of the file
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.digest()
+
+
+def write(filename: str, endtimes, loudness, rate: int = 0, frame_size: int = 0, source: str = None,
+          endtime_type=np.float64, loudness_type=np.float32) -> str:
+    """
+    Writes a series of signals as binary file.
+    :param filename: The path to the file
+    :param endtimes: The end time of every signal in seconds
+    :param loudness: The loudness of every signal
+    :param rate: Sample rate of the analysed audio, 0 if unknown
+    :param frame_size: Number of samples per analysed frame, 0 if unknown
+    :param source: Path of the file the series has been extracted from, its hash is stored in the header
+    :param endtime_type: Type of the end times, either np.float32 or np.float64
+    :param loudness_type: Type of the loudness, either np.float32 or np.float64
+    :return: The path to the file
+    """
+    endtimes = np.asarray(endtimes, dtype=np.dtype(endtime_type).newbyteorder('<'))
+    loudness = np.asarray(loudness, dtype=np.dtype(loudness_type).newbyteorder('<'))
+    if len(endtimes) != len(loudness):
+        raise ValueError("the columns differ in length (%d, %d)" % (len(endtimes), len(loudness)))
+
+    types = CODES[np.dtype(endtime_type)] + CODES[np.dtype(loudness_type)]
+    hashed = digest(source) if source is not None else bytes(20)
+
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, types, rate, frame_size, len(endtimes), hashed))
+        file.write(endtimes.tobytes())
+        file.write(bytes(_aligned(endtimes.nbytes) - endtimes.nbytes))
+        file.write(loudness.tobytes())
+    return filename
+
+
+def is_series(filename: str) -> bool:
+    """
+    :param filename: The path to a file
+    :return: Whether the file is a binary series file, judging by its magic number
+    """
+    with open(filename, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_csv(filename: str) -> tuple:
+    """
+    Reads a series of signals from a CSV file with the columns 'endtime' and 'loudness'.
+    :param filename: The path to the CSV file
+    :return: (endtimes, loudness) as arrays
+    """
+    with open(filename, newline='') as csv_file:
+        header = next(csv.reader(csv_file), [])
+        if 'endtime' not in header or 'loudness' not in header:
+            raise ValueError("'%s' lacks the columns 'endtime' and 'loudness'" % filename)
+        columns = (header.index('endtime'), header.index('loudness'))
+        data = np.loadtxt(csv_file, delimiter=',', usecols=columns, ndmin=2)
+    return data[:, 0], data[:, 1]
+
+
+def write_csv(filename: str, endtimes, loudness) -> str:
+    """
+    Writes a series of signals as CSV file with the columns 'endtime' and 'loudness'.
+    :param filename: The path to the CSV file
+    :param endtimes: The end time of every signal in seconds
+    :param loudness: The loudness of every signal
+    :return: The path to the CSV file
+    """
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['endtime'] + ['loudness'])
+
+        for endtime, level in zip(np.asarray(endtimes).tolist(), np.asarray(loudness).tolist()):
+            writer.writerow([round(endtime, 4)] + [round(level, 4)])
+    return filename
+
+
+def convert(source: str, target: str) -> str:
+    """
+    Converts a CSV file into a binary series file or the other way round, depending on the format of the source.
+    :param source: The path to the file to convert
+    :param target: The path to the converted file
+    :return: The path to the converted file
+    """
+    if is_series(source):
+        series = SeriesFile(source)
+        return write_csv(target, series.endtimes, series.loudness)
+    endtimes, loudness = read_csv(source)
+    return write(target, endtimes, loudness)
@@ -0,0 +1,397 @@
+import asyncio
+import json
+import logging
+import struct
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from live import StreamDecoder
+from resampler import Resampler
+from wavfile import WaveFile
+
+# Every frame starts with its type and the length of its payload
+HEADER = struct.Struct('>BI')
+
+# Frame types sent by the client: the options of the session as JSON, a part of the audio and the end of the audio
+START = 0x01
+DATA = 0x02
+END = 0x03
+
+# Frame types sent by the server: decoded characters, a summary of the session as JSON and the reason of an abort
+TEXT = 0x81
+DONE = 0x82
+ERROR = 0x83
+
+# The audio of a session is either a whole wave file or a stream of signed 16 bit little-endian mono samples
+FORMATS = ('wav', 'pcm')
+
+
+async def read_frame(reader: asyncio.StreamReader, limit: int) -> tuple:
+    """
+    Reads the next frame.
+    :param reader: The stream to read from
+    :param limit: The maximum length of a payload
+    :return: (type, payload) or (None, b'') if the stream has ended in between two frames
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise ValueError('incomplete frame header')
+        return None, b''
+
+    kind, length = HEADER.unpack(header)
+    if length > limit:
+        raise ValueError('frame of %d bytes exceeds the limit of %d bytes' % (length, limit))
+    try:
+        return kind, await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ValueError('incomplete frame')
+
+
+async def write_frame(writer: asyncio.StreamWriter, kind: int, payload: bytes = b'') -> None:
+    """
+    Writes a frame and waits until the peer has taken enough of the written data.
+    :param writer: The stream to write to
+    :param kind: The type of the frame
+    :param payload: The payload of the frame
+    """
+    writer.write(HEADER.pack(kind, len(payload)) + payload)
+    await writer.drain()
+
+
+class Session:
+    """
+    The decoding state of a single connection. Its methods are called by the worker threads, but never concurrently.
+    """
+
+    def __init__(self, options: dict, rate: int):
+        """
+        Configures the session.
+        :param options: 'format' of the audio, 'rate' of the PCM samples, expected speed 'wpm' and the 'window' of
+                        marks the speed is tracked over
+        :param rate: The sample rate the audio is decoded at
+        """
+        if not isinstance(options, dict):
+            raise ValueError('options have to be a JSON object')
+
+        self.format = options.get('format', 'pcm')
+        if self.format not in FORMATS:
+            raise ValueError("unknown format '%s'" % self.format)
+
+        try:
+            self.rate = int(options.get('rate', rate))
+            wpm = int(options.get('wpm', 12))
+            window = int(options.get('window', 32))
+        except (TypeError, ValueError):
+            raise ValueError("'rate', 'wpm' and 'window' have to be integers")
+        if self.rate <= 0:
+            raise ValueError('invalid sample rate %d' % self.rate)
+        if wpm <= 0 or window < 0:
+            raise ValueError("'wpm' has to be positive and 'window' must not be negative")
+
+        self.stream = StreamDecoder(rate=rate, wpm=wpm, window=window)
+        self._resampler = Resampler(self.rate, rate) if self.format == 'pcm' and self.rate != rate else None
+        self._working_rate = rate
+        self._pending = b''
+        self._blocks = None
+        self.samples = 0
+
+    def feed(self, payload: bytes) -> str:
+        """
+        Decodes the next part of a PCM stream.
+        :param payload: Signed 16 bit little-endian samples, a sample may be split between two payloads
+        :return: The characters that have been completed
+        """
+        payload = self._pending + payload
+        usable = len(payload) - len(payload) % 2
+        self._pending = payload[usable:]
+
+        samples = np.frombuffer(payload, dtype='<i2', count=usable // 2).astype(np.float64)
+        self.samples += len(samples)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        return self.stream.feed(samples)
+
+    def open(self, content: bytearray) -> WaveFile:
+        """
+        Prepares the decoding of an uploaded wave file.
+        :param content: The content of the file
+        :return: The wave file
+        """
+        waveform = WaveFile(content)
+        self.rate = waveform.framerate
+        self.samples = waveform.nframes
+        self._blocks = waveform.blocks(rate=self._working_rate)
+        return waveform
+
+    def step(self):
+        """
+        Decodes the next block of the uploaded wave file.
+        :return: The characters that have been completed or None if the file is done
+        """
+        block = next(self._blocks, None)
+        return None if block is None else self.stream.feed(block)
+
+    def finish(self) -> str:
+        return self.stream.finish()
+
+    def summary(self) -> dict:
+        return {'characters': self.stream.count, 'seconds': self.samples / self.rate,
+                'wpm': self.stream.tracker.wpm}
+
+
+class Server:
+    """
+    A decode service on a TCP or Unix socket that decodes many sessions concurrently. Each connection is a session:
+    the client sends a START frame with its options, the audio in DATA frames and an END frame, the server answers with
+    TEXT frames as soon as characters are complete and a DONE frame (or an ERROR frame) at the end.
+
+    The FFT and the classification run in a bounded pool of worker threads. Every session has at most one job in
+    flight and a bounded queue of received frames, so a client that sends faster than its audio is decoded stops
+    being read and is slowed down by TCP's flow control.
+    """
+
+    def __init__(self, workers: int = None, sessions: int = 16, rate: int = 8000, frame_limit: int = 1 << 20,
+                 upload_limit: int = 64 << 20, duration_limit: float = 4 * 3600.0, timeout: float = 30.0,
+                 queue: int = 8) -> None:
+        """
+        Configures the service.
+        :param workers: Number of worker threads, the default of ThreadPoolExecutor if not set
+        :param sessions: Maximum number of concurrent sessions, further connections are rejected
+        :param rate: The sample rate the audio is decoded at
+        :param frame_limit: Maximum payload of a frame in bytes
+        :param upload_limit: Maximum size of an uploaded wave file in bytes
+        :param duration_limit: Maximum duration of the audio of a session in seconds
+        :param timeout: Time in seconds after which a session is closed whose peer neither sends nor takes frames
+        :param queue: Number of received frames per session that wait for decoding
+        """
+        self.rate = rate
+        self.sessions = sessions
+        self.frame_limit = frame_limit
+        self.upload_limit = upload_limit
+        self.duration_limit = duration_limit
+        self.timeout = timeout
+        self.queue = queue
+
+        self.logger = logging.getLogger('server')
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode')
+        self._active = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 7373, path: str = None) -> asyncio.AbstractServer:
+        """
+        Starts listening.
+        :param host: The address of the TCP socket
+        :param port: The port of the TCP socket
+        :param path: The path of a Unix socket, which is used instead of the TCP socket if set
+        :return: The listening server
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path=path)
+        return await asyncio.start_server(self._handle, host=host, port=port)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 7373, path: str = None) -> None:
+        """
+        Serves until cancelled.
+        """
+        listener = await self.start(host, port, path)
+        self.logger.info("Listening on %s", path or '%s:%d' % (host, port))
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info('peername') or 'unix socket'
+        try:
+            if self._active >= self.sessions:
+                self.logger.info("Session of %s rejected: %d sessions active", peer, self._active)
+                await self._write(writer, ERROR, b'too many sessions')
+                return
+
+            self._active += 1
+            try:
+                with metrics.stage('session'):
+                    summary = await self._session(reader, writer)
+                await self._write(writer, DONE, json.dumps(summary).encode())
+                self.logger.info("Session of %s done: %.1f s of audio", peer, summary['seconds'])
+            except (ValueError, wave.Error, asyncio.TimeoutError) as error:
+                message = str(error) or 'session timed out'
+                self.logger.info("Session of %s aborted: %s", peer, message)
+                await self._write(writer, ERROR, message.encode())
+            except Exception:
+                self.logger.exception("Session of %s failed", peer)
+                await self._write(writer, ERROR, b'internal error')
+            finally:
+                self._active -= 1
+        except ConnectionError as error:
+            self.logger.info("Connection of %s lost: %s", peer, error)
+
+            # Data that a stalled peer has not taken yet must not keep the connection open
+            writer.transport.abort()
+        finally:
+            writer.close()
+
+    async def _write(self, writer: asyncio.StreamWriter, kind: int, payload: bytes = b'') -> None:
+        """
+        Writes a frame, a peer that does not take it within the timeout is treated as lost.
+        """
+        try:
+            await asyncio.wait_for(write_frame(writer, kind, payload), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError('frames are not taken')
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> dict:
+        kind, payload = await asyncio.wait_for(read_frame(reader, self.frame_limit), self.timeout)
+        if kind != START:
+            raise ValueError('session has to begin with a START frame')
+        try:
+            options = json.loads(payload.decode() or '{}')
+        except ValueError:
+            raise ValueError('options are no valid JSON')
+        session = Session(options, self.rate)
+
+        # The frames are received while the previous ones are decoded, the queue limits how far the receiver is ahead
+        frames = asyncio.Queue(self.queue)
+        receiver = asyncio.ensure_future(self._receive(reader, session, frames))
+        try:
+            if session.format == 'pcm':
+                await self._decode_stream(writer, session, frames)
+            else:
+                await self._decode_upload(writer, session, frames)
+        finally:
+            receiver.cancel()
+
+        metrics.annotate(frames=session.samples)
+        return session.summary()
+
+    async def _receive(self, reader: asyncio.StreamReader, session: Session, frames: asyncio.Queue) -> None:
+        """
+        Reads the DATA frames of a session into the queue and passes on errors, the end of the audio is queued as None.
+        """
+        received = 0
+        try:
+            while True:
+                kind, payload = await asyncio.wait_for(read_frame(reader, self.frame_limit), self.timeout)
+                if kind == END:
+                    break
+                if kind != DATA:
+                    raise ValueError('connection closed before the END frame' if kind is None else
+                                     'unexpected frame of type %d' % kind)
+
+                received += len(payload)
+                if session.format == 'wav' and received > self.upload_limit:
+                    raise ValueError('upload exceeds the limit of %d bytes' % self.upload_limit)
+                if session.format == 'pcm' and received / (2 * session.rate) > self.duration_limit:
+                    raise ValueError('audio exceeds the limit of %.0f s' % self.duration_limit)
+                await frames.put(payload)
+            await frames.put(None)
+        except (ValueError, asyncio.TimeoutError, ConnectionError) as error:
+            await frames.put(error)
+
+    @staticmethod
+    async def _next(frames: asyncio.Queue):
+        payload = await frames.get()
+        if isinstance(payload, Exception):
+            raise payload
+        return payload
+
+    async def _decode_stream(self, writer: asyncio.StreamWriter, session: Session, frames: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            payload = await self._next(frames)
+            if payload is None:
+                break
+            characters = await loop.run_in_executor(self._executor, session.feed, payload)
+            if characters:
+                await self._write(writer, TEXT, characters.encode())
+
+        characters = await loop.run_in_executor(self._executor, session.finish)
+        if characters:
+            await self._write(writer, TEXT, characters.encode())
+
+    async def _decode_upload(self, writer: asyncio.StreamWriter, session: Session, frames: asyncio.Queue) -> None:
+        content = bytearray()
+        while True:
+            payload = await self._next(frames)
+            if payload is None:
+                break
+            content += payload
+
+        loop = asyncio.get_running_loop()
+        waveform = await loop.run_in_executor(self._executor, session.open, content)
+        if waveform.nframes / waveform.framerate > self.duration_limit:
+            raise ValueError('audio exceeds the limit of %.0f s' % self.duration_limit)
+
+        # The file is decoded block by block, so that other sessions get their turn and the text arrives early
+        while True:
+            characters = await loop.run_in_executor(self._executor, session.step)
+            if characters is None:
+                break
+            if characters:
+                await self._write(writer, TEXT, characters.encode())
+
+        characters = await loop.run_in_executor(self._executor, session.finish)
+        if characters:
+            await self._write(writer, TEXT, characters.encode())
+
+
+async def send(filename: str, host: str = '127.0.0.1', port: int = 7373, path: str = None, pcm: bool = False,
+               chunk: int = 1 << 14, options: dict = None, on_characters=None) -> dict:
+    """
+    A test client that sends a wave file to the decode service, either as upload or as stream of PCM samples.
+    :param filename: The path to the wave file
+    :param host: The address of the service
+    :param port: The port of the service
+    :param path: The path of the Unix socket of the service, which is used instead of TCP if set
+    :param pcm: Should the samples be streamed instead of uploading the file?
+    :param chunk: Number of bytes per DATA frame
+    :param options: Further options of the session, e.g. 'wpm'
+    :param on_characters: Called with every group of decoded characters
+    :return: The summary of the session
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    async def _send():
+        if pcm:
+            waveform = WaveFile(filename)
+            await write_frame(writer, START, json.dumps(dict(options or {}, format='pcm',
+                                                              rate=waveform.framerate)).encode())
+            for block in waveform.blocks(chunk // 2):
+                samples = np.clip(np.round(block), -32768, 32767).astype('<i2')
+                await write_frame(writer, DATA, samples.tobytes())
+        else:
+            await write_frame(writer, START, json.dumps(dict(options or {}, format='wav')).encode())
+            with open(filename, 'rb') as file:
+                for content in iter(lambda: file.read(chunk), b''):
+                    await write_frame(writer, DATA, content)
+        await write_frame(writer, END)
+
+    # The answers are read while sending, otherwise the backpressure of both directions could block each other
+    sender = asyncio.ensure_future(_send())
+    try:
+        while True:
+            kind, payload = await read_frame(reader, 1 << 24)
+            if kind == TEXT:
+                if on_characters is not None:
+                    on_characters(payload.decode())
+            elif kind == DONE:
+                return json.loads(payload.decode())
+            elif kind == ERROR:
+                raise ValueError(payload.decode())
+            else:
+                raise ValueError('connection closed by the service')
+    finally:
+        sender.cancel()
+        try:
+            await sender
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        writer.close()
@@ -0,0 +1,122 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+class Stft:
+    """
+    A vectorized short-time Fourier transform that frames whole blocks of samples at once.
+    """
+
+    # Relevant part of the spectrum (exclude edge cases)
+    LOWER_BOUND = 10
+    UPPER_RATIO = 0.45
+
+    def __init__(self, frame_size: int = 256, hop: int = None, window: str = None, block: int = 4096):
+        """
+        Configures the framing engine.
+        :param frame_size: Number of samples per frame
+        :param hop: Number of samples between the starts of two frames (defaults to the frame size)
+        :param window: Name of a window function (e.g. 'hann'), rectangular if not set
+        :param block: Number of frames that are transformed together in one batch
+        """
+        self.frame_size = frame_size
+        self.hop = hop or frame_size
+        self.block = block
+        self._window_name = window
+        self._windows = dict()
+
+    def _window(self, size: int):
+        """
+        Returns the cached window for the given frame size.
+        :param size: The length of the frame
+        :return: The window as an array or None for a rectangular window
+        """
+        if self._window_name is None:
+            return None
+        if size not in self._windows:
+            from scipy.signal import get_window
+            self._windows[size] = get_window(self._window_name, size)
+        return self._windows[size]
+
+    def reset(self) -> None:
+        """
+        Prepares the analysis of a new recording, the transform itself keeps no state between recordings.
+        """
+
+    def frame_count(self, n_samples: int) -> int:
+        """
+        Returns the number of frames (including a trailing partial frame) for the given number of samples.
+        :param n_samples: The number of samples
+        :return: The number of frames
+        """
+        if n_samples <= 0:
+            return 0
+        return -(-max(n_samples - self.frame_size, 0) // self.hop) + 1
+
+    def frames(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns all complete frames of the given samples as a read-only 2-D view without copying them.
+        :param samples: A 1-D array of samples
+        :return: An array of the shape (frames, frame size)
+        """
+        samples = np.asarray(samples)
+        count = 0
+        if len(samples) >= self.frame_size:
+            count = (len(samples) - self.frame_size) // self.hop + 1
+        stride = samples.strides[0]
+        return as_strided(samples, shape=(count, self.frame_size), strides=(self.hop * stride, stride),
+                          writeable=False)
+
+    def spectra(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Transforms a batch of frames and reduces the result to the relevant part of the spectrum.
+        :param frames: An array of the shape (frames, frame length)
+        :return: The scaled magnitudes of the relevant frequency bins for every frame
+        """
+        size = frames.shape[1]
+        window = self._window(size)
+        if window is not None:
+            frames = frames * window
+        upper_bound = round(self.UPPER_RATIO * size)
+        spectrum = np.fft.rfft(frames, axis=1)[:, self.LOWER_BOUND:upper_bound]
+        return np.abs(spectrum) / (128 * self.frame_size)
+
+    def band_extrema(self, samples: np.ndarray, partial: bool = True) -> tuple:
+        """
+        Calculates the maximum and minimum of the relevant spectrum of every frame.
+        :param samples: A 1-D array of samples
+        :param partial: Should a trailing partial frame be analysed as well?
+        :return: (maxima, minima) as two arrays with one value per frame
+        """
+        samples = np.asarray(samples)
+        frames = self.frames(samples)
+        maxima = np.empty(len(frames))
+        minima = np.empty(len(frames))
+
+        for start in range(0, len(frames), self.block):
+            spectra = self.spectra(frames[start:start + self.block])
+            maxima[start:start + len(spectra)] = spectra.max(axis=1)
+            minima[start:start + len(spectra)] = spectra.min(axis=1)
+
+        # A trailing partial frame is transformed on its own
+        if partial and self.frame_count(len(samples)) > len(frames):
+            spectra = self.spectra(samples[np.newaxis, len(frames) * self.hop:])
+            if spectra.shape[1] > 0:
+                maxima = np.append(maxima, spectra.max(axis=1))
+                minima = np.append(minima, spectra.min(axis=1))
+
+        return maxima, minima
+
+
+def gate(maxima: np.ndarray, minima: np.ndarray, threshold: float = 0.0) -> tuple:
+    """
+    Chooses the maximum of a frame if it exceeds half of the loudest maximum so far, otherwise its minimum.
+    :param maxima: The maxima of the frames
+    :param minima: The minima of the frames
+    :param threshold: The threshold carried over from previous frames
+    :return: (values, threshold) with the chosen value per frame and the threshold after the last frame
+    """
+    if len(maxima) == 0:
+        return np.empty(0), threshold
+    thresholds = np.maximum(threshold, np.maximum.accumulate(maxima) / 2)
+    return np.where(maxima > thresholds, maxima, minima), float(thresholds[-1])
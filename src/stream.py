@@ -0,0 +1,308 @@
+import logging
+
+import numpy as np
+
+from decoder import Decoder, Signal
+from segmenter import Segmenter
+from stft import gate
+from timing import PAUSE_SHORT, SIGNALS, SpeedTracker
+
+
+class _Lead:
+    """
+    Holds back the first arrays of a stream until they are at least as long as the lead.
+    """
+
+    def __init__(self, length: int):
+        self.length = length
+        self._head = list()
+        self._collected = 0
+
+    def push(self, array: np.ndarray):
+        """
+        :param array: The next array of the stream
+        :return: The joined first arrays once they are long enough, the given array after that, None while held back
+        """
+        if self._head is None:
+            return array
+        self._head.append(array)
+        self._collected += len(array)
+        if self._collected < self.length:
+            return None
+        return self.release()
+
+    def release(self):
+        """
+        :return: The joined arrays that are still held back (e.g. at the end of a short stream), None if there are none
+        """
+        head, self._head = self._head, None
+        return np.concatenate(head) if head else None
+
+
+class Envelope:
+    """
+    Turns blocks of samples into the gated loudness of the tone, one value per frame.
+    """
+
+    def __init__(self, detector, denoiser=None, survey: int = 0):
+        """
+        Configures the stage.
+        :param detector: The tone detector, a Stft or Goertzel
+        :param denoiser: Optional Denoiser that is applied to the samples before the detection
+        :param survey: Number of samples that are collected before the first block is processed, the denoiser and the
+                       Goertzel detector acquire the tone from them
+        """
+        self.detector = detector
+        self.denoiser = denoiser
+        self._lead = _Lead(survey)
+        self._pending = np.empty(0)
+        self._threshold = 0.0
+        self._count = 0
+        self._frames = 0
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        """
+        :param samples: The next samples at the rate of the detector
+        :return: The loudness of every frame that has been completed by these samples
+        """
+        samples = self._lead.push(samples)
+        return np.empty(0) if samples is None else self._process(samples)
+
+    def finish(self) -> np.ndarray:
+        """
+        :return: The loudness of the remaining frames, including the trailing partial frame
+        """
+        samples = self._lead.release()
+        values = self._process(samples) if samples is not None else np.empty(0)
+
+        remaining = self.detector.frame_count(self._count) - self._frames
+        if len(self._pending) > 0 and remaining > 0:
+            maxima, minima = self.detector.band_extrema(self._pending)
+            trailing, self._threshold = gate(maxima[:remaining], minima[:remaining], self._threshold)
+            values = np.concatenate((values, trailing))
+            self._frames += len(trailing)
+        self._pending = np.empty(0)
+        return values
+
+    def _process(self, samples: np.ndarray) -> np.ndarray:
+        if self.denoiser is not None:
+            samples = self.denoiser.process_chunk(samples)
+        self._count += len(samples)
+
+        # Frames may span two blocks, the samples of an incomplete frame are carried over
+        pending = np.concatenate((self._pending, samples))
+        maxima, minima = self.detector.band_extrema(pending, partial=False)
+        self._pending = pending[len(maxima) * self.detector.hop:]
+        self._frames += len(maxima)
+
+        values, self._threshold = gate(maxima, minima, self._threshold)
+        return values
+
+
+class Runs:
+    """
+    Splits the loudness of the frames into runs of marks and spaces. The loudest of the first frames is the initial
+    reference of the normalization, so that noise before the first mark is not normalized to full loudness.
+    """
+
+    def __init__(self, tolerance: float = 0.48, lead: int = 64):
+        """
+        Configures the stage.
+        :param tolerance: Loudness area in which the signal is thought to be the same
+        :param lead: Number of frames that are collected before the first runs are split
+        """
+        self._segmenter = Segmenter(tolerance)
+        self._lead = _Lead(lead)
+        self._start = 0
+
+    @property
+    def open(self) -> tuple:
+        """
+        :return: (frames, level) of the run that has not ended yet
+        """
+        return self._segmenter.count - self._start, float(self._segmenter.level)
+
+    def push(self, values: np.ndarray) -> list:
+        """
+        :param values: The loudness of the next frames
+        :return: (frames, level) for every completed run with its length in frames and its normalized loudness
+        """
+        values = self._lead.push(values)
+        return [] if values is None else self._split(values)
+
+    def finish(self) -> list:
+        """
+        :return: The remaining runs, the last run ends with the recording
+        """
+        values = self._lead.release()
+        runs = self._split(values) if values is not None else list()
+
+        frames, level = self.open
+        if frames > 0:
+            runs.append((frames, level))
+            self._start = self._segmenter.count
+        return runs
+
+    def _split(self, values: np.ndarray) -> list:
+        if self._segmenter.count == 0 and len(values) > 0:
+            self._segmenter.prime(float(values.max()))
+
+        runs = list()
+        x, y = self._segmenter.push(values)
+        for end, level in zip(x.tolist(), y.tolist()):
+            runs.append((end - self._start, level))
+            self._start = end
+        return runs
+
+
+class Signals:
+    """
+    Classifies the runs by the tracked speed. Adjacent runs of the same kind (e.g. split by a frame at half loudness)
+    are joined, silence before the first mark is skipped and the last character is completed by a long pause.
+    """
+
+    def __init__(self, frame_duration: float, tracker: SpeedTracker = None):
+        """
+        Configures the stage.
+        :param frame_duration: Duration of a frame in seconds
+        :param tracker: The speed tracker, one that starts at 12 WPM if not set
+        """
+        self.frame_duration = frame_duration
+        self.tracker = tracker or SpeedTracker()
+
+        # The kind of the joined run that waits for a run of the other kind (None before the first mark) and its length
+        self._current = None
+        self._length = 0
+
+        # Whether the last character lacks its final pause and whether the current pause has already been passed on
+        self._incomplete = False
+        self._flushed = False
+
+    def push(self, runs: list) -> list:
+        """
+        :param runs: (frames, level) of the next completed runs
+        :return: The signals that have been completed by these runs
+        """
+        signals = list()
+        for frames, level in runs:
+            mark = level > 0.5
+            if mark == self._current:
+                self._length += frames
+                continue
+
+            if self._current is not None:
+                signals.extend(self._complete())
+            if mark or self._current is not None:
+                self._current, self._length = mark, frames
+        return signals
+
+    def flush(self, frames: int, level: float) -> list:
+        """
+        Completes the character as soon as the pause that has not ended yet is long enough for a word pause, without
+        waiting for the next mark.
+        :param frames: The length of the open run in frames
+        :param level: The normalized loudness of the open run
+        :return: The signals that have been completed
+        """
+        if self._current is None or self._flushed or level > 0.5:
+            return []
+
+        pause = frames + (self._length if self._current is False else 0)
+        if pause * self.frame_duration < 5 * self.tracker.dit:
+            return []
+
+        signals = self._complete() if self._current else list()
+        if self._current:
+            self._current, self._length = False, 0
+        signals.append(Signal.PAUSE_LONG)
+        self._incomplete = False
+        self._flushed = True
+        return signals
+
+    def finish(self) -> list:
+        """
+        :return: The remaining signals, the last character is completed
+        """
+        signals = self._complete() if self._current is not None else list()
+        self._current = None
+        if self._incomplete:
+            signals.append(Signal.PAUSE_LONG)
+            self._incomplete = False
+        return signals
+
+    def _complete(self) -> list:
+        if self._flushed:
+            # This pause has already been passed on while it lasted
+            self._flushed = False
+            return []
+
+        label = self.tracker.classify(self._length * self.frame_duration, self._current)
+        self._incomplete = self._current or label == PAUSE_SHORT
+        return [SIGNALS[label]]
+
+
+def envelopes(blocks, detector, denoiser=None, survey: int = 0):
+    """
+    Turns blocks of samples into the gated loudness of the tone, see Envelope.
+    :param blocks: An iterable of sample arrays at the rate of the detector
+    :param detector: The tone detector, a Stft or Goertzel
+    :param denoiser: Optional Denoiser that is applied to the samples before the detection
+    :param survey: Number of samples from which the tone is acquired before the first block is processed
+    :return: A generator of loudness arrays
+    """
+    stage = Envelope(detector, denoiser, survey)
+    for block in blocks:
+        values = stage.push(block)
+        if len(values) > 0:
+            yield values
+
+    values = stage.finish()
+    if len(values) > 0:
+        yield values
+
+
+def runs(loudness, tolerance: float = 0.48, lead: int = 64):
+    """
+    Splits the loudness of the frames into marks and spaces, see Runs.
+    :param loudness: An iterable of loudness arrays
+    :param tolerance: Loudness area in which the signal is thought to be the same
+    :param lead: Number of frames that are collected before the first runs are split
+    :return: A generator of (frames, level) for every run, the last run ends with the recording
+    """
+    stage = Runs(tolerance, lead)
+    for values in loudness:
+        yield from stage.push(values)
+    yield from stage.finish()
+
+
+def signals(segments, frame_duration: float, tracker: SpeedTracker = None):
+    """
+    Classifies the runs by the tracked speed, see Signals.
+    :param segments: An iterable of (frames, level) for every run
+    :param frame_duration: Duration of a frame in seconds
+    :param tracker: The speed tracker, one that starts at 12 WPM if not set
+    :return: A generator of signals
+    """
+    stage = Signals(frame_duration, tracker)
+    for segment in segments:
+        yield from stage.push([segment])
+    yield from stage.finish()
+
+
+def characters(symbols, logger: logging.Logger = None):
+    """
+    Decodes the signals.
+    :param symbols: An iterable of signals
+    :param logger: The logger of the decoder
+    :return: A generator of the decoded text, in pieces as soon as they are complete
+    """
+    text = list()
+    decoder = Decoder(logger or logging.getLogger('decoder'), text.append)
+    for symbol in symbols:
+        decoder.decode(symbol)
+        if text:
+            yield ''.join(text)
+            text.clear()
+
+            # The message is already passed on, the decoder does not need to keep it
+            decoder.message = ''
@@ -0,0 +1,284 @@
+from collections import deque
+
+import numpy as np
+
+import metrics
+from decoder import Signal
+
+# Internal labels of the signals
+SHORT, LONG, PAUSE_SHORT, PAUSE_MEDIUM, PAUSE_LONG = range(5)
+
+# Signal of every label
+SIGNALS = {SHORT: Signal.SHORT, LONG: Signal.LONG, PAUSE_SHORT: Signal.PAUSE_SHORT, PAUSE_MEDIUM: Signal.PAUSE_MEDIUM,
+           PAUSE_LONG: Signal.PAUSE_LONG}
+
+# Length of every signal in DITs: DIT, DAH and the pauses within a character, between characters and between words
+UNITS = np.array([1.0, 3.0, 1.0, 3.0, 7.0])
+
+
+def otsu(values: np.ndarray, bins: int = 64) -> float:
+    """
+    Finds the threshold that splits the given values into two classes with the largest variance between them.
+    :param values: The values to split
+    :param bins: Number of bins of the histogram the threshold is searched in
+    :return: The threshold
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return 0.0
+    low, high = values.min(), values.max()
+    if low == high:
+        return float(low)
+
+    counts, edges = np.histogram(values, bins=bins, range=(low, high))
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    # Weight and mean of the lower class for every possible split, the upper class follows from the totals
+    weights = np.cumsum(counts)[:-1].astype(np.float64)
+    sums = np.cumsum(counts * centers)[:-1]
+    total, total_sum = weights[-1] + counts[-1], sums[-1] + counts[-1] * centers[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower = sums / weights
+        upper = (total_sum - sums) / (total - weights)
+        variances = weights * (total - weights) * (lower - upper) ** 2
+    return float(edges[1:-1][np.nanargmax(variances)])
+
+
+class TimingClassifier:
+    """
+    Classifies signals by the 1:3:7 timing of morse code: marks are told apart from pauses by their loudness and all
+    durations are measured in multiples of a DIT, which is estimated from the data.
+    """
+    _prediction: np.ndarray
+
+    # Loudness that separates marks from pauses, duration of a DIT and the mean squared error of the training data
+    _threshold: float = 0.5
+    _dit: float = 0.0
+    _reference: float = 0.0
+
+    def __init__(self, plot: bool = False):
+        """
+        Configures the classifier.
+        :param plot: Should the classified signals be displayed?
+        """
+        self._plot = plot
+
+    def train(self, batch: list) -> np.ndarray:
+        """
+        Estimates the loudness threshold and the duration of a DIT from the given batch and classifies it.
+        :param batch: Training data in the form of an array of pairs or a list of tuples.
+        :return: Returns an array of labels for each data point
+        """
+        data = np.asarray(batch, dtype=np.float64).reshape(-1, 2)
+        metrics.annotate(items=len(data))
+
+        self._threshold = otsu(data[:, 1])
+        marks = data[:, 1] > self._threshold
+        self._dit = self._estimate(data[marks, 0], data[~marks, 0])
+        metrics.annotate(dit=self._dit, wpm=1.2 / self._dit if self._dit else 0.0)
+
+        self._prediction, errors = self._predict(data)
+        self._reference = errors.mean() if len(errors) else 0.0
+
+        self._show(data)
+        return self._prediction
+
+    def classify(self, batch: list, refine: float = None) -> np.ndarray:
+        """
+        Classifies the given batch with the estimates of a trained or loaded classifier.
+        :param batch: Data in the form of an array of pairs or a list of tuples.
+        :param refine: If the mean squared error of the batch exceeds this multiple of the one of the training data,
+                       the estimates are made anew from the batch.
+        :return: Returns an array of labels for each data point
+        """
+        data = np.asarray(batch, dtype=np.float64).reshape(-1, 2)
+        self._prediction, errors = self._predict(data)
+        quality = errors.mean() if len(errors) else 0.0
+
+        if refine is not None and quality > refine * self._reference and len(data) > 0:
+            print("Refining timing (mean squared error %f, reference %f)" % (quality, self._reference))
+            return self.train(data)
+
+        metrics.annotate(items=len(data))
+        self._show(data)
+        return self._prediction
+
+    @staticmethod
+    def _estimate(marks: np.ndarray, pauses: np.ndarray) -> float:
+        """
+        Estimates the duration of a DIT from the durations of the marks, which split into DITs and DAHs.
+        :param marks: Durations of the marks
+        :param pauses: Durations of the pauses, used if the marks are all of the same kind
+        :return: The duration of a DIT in seconds
+        """
+        marks = marks[marks > 0]
+        pauses = pauses[pauses > 0]
+        if len(marks) == 0:
+            return float(np.median(pauses)) if len(pauses) else 0.0
+
+        # Durations are compared in the log domain, where a DAH is as far from a DIT at any speed
+        logarithms = np.log(marks)
+        split = otsu(logarithms)
+        short, long = logarithms[logarithms <= split], logarithms[logarithms > split]
+        if len(long) and np.exp(np.median(long) - np.median(short)) > 2:
+            return float(np.exp(np.median(short)))
+
+        # Only one kind of marks, the pauses within characters last a DIT
+        dit = float(np.exp(np.median(logarithms)))
+        pauses = pauses[pauses < 2 * dit]
+        return min(dit, float(np.median(pauses))) if len(pauses) else dit
+
+    def _predict(self, data: np.ndarray) -> tuple:
+        """
+        Assigns every data point to a signal by its loudness and its duration in DITs.
+        :param data: An array of data points
+        :return: (labels, squared errors of the durations in log2 units) for every data point
+        """
+        units = data[:, 0] / self._dit if self._dit > 0 else np.zeros(len(data))
+        marks = data[:, 1] > self._threshold
+
+        # The thresholds lie between the ideal lengths of 1, 3 and 7 DITs
+        labels = np.where(marks, np.where(units < 2, SHORT, LONG),
+                          np.select([units < 2, units < 5], [PAUSE_SHORT, PAUSE_MEDIUM], PAUSE_LONG))
+        return labels, self._errors(units, labels)
+
+    @staticmethod
+    def _errors(units: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """
+        :param units: The duration of every signal in DITs
+        :param labels: The label of every signal
+        :return: The squared deviation of every signal from its ideal length in log2 units
+        """
+        # Word pauses are often much longer than 7 DITs, they only count if they are too short
+        ratios = units / UNITS[labels]
+        ratios[labels == PAUSE_LONG] = np.minimum(ratios[labels == PAUSE_LONG], 1.0)
+        return np.log2(np.maximum(ratios, 1e-3)) ** 2
+
+    def _show(self, data: np.ndarray) -> None:
+
+        if self._plot:
+            import matplotlib.pyplot as plt
+            plt.figure(figsize=(12, 12))
+            plt.scatter(data[:, 0], data[:, 1], c=self._prediction)
+            plt.title("1:3:7 timing")
+            plt.show()
+
+    def get_label_mapping(self) -> dict:
+        """
+        Matches the internal labels to pre-defined enums that contain semantics.
+        :return: A mapping that contains a Signal for every internally used label.
+        """
+        return dict(SIGNALS)
+
+    def save(self, filename: str) -> None:
+        """
+        Stores the estimates in a compact file.
+        :param filename: The path to the file (a NumPy .npz archive)
+        """
+        with open(filename, 'wb') as file:
+            np.savez(file, threshold=self._threshold, dit=self._dit, reference=self._reference)
+
+    @classmethod
+    def load(cls, filename: str, plot: bool = False):
+        """
+        Loads estimates that have been stored before.
+        :param filename: The path to the file
+        :param plot: Should the classified signals be displayed?
+        :return: A classifier that can classify new batches right away
+        """
+        with np.load(filename) as archive:
+            if 'dit' not in archive:
+                raise ValueError("'%s' is not a timing model" % filename)
+            classifier = cls(plot)
+            classifier._threshold = float(archive['threshold'])
+            classifier._dit = float(archive['dit'])
+            classifier._reference = float(archive['reference'])
+        return classifier
+
+
+class SpeedTracker:
+    """
+    Follows the speed of a stream of signals: every signal is classified against the current estimate of the
+    duration of a DIT, which is estimated anew from a sliding window of the latest marks and pauses.
+    """
+
+    def __init__(self, dit: float = 0.1, window: int = 32, interval: int = 8):
+        """
+        Configures the tracker.
+        :param dit: Initial duration of a DIT in seconds
+        :param window: Number of latest marks (and pauses) the estimate is based on, 0 keeps the initial speed
+        :param interval: Number of marks after which the estimate is updated
+        """
+        self.dit = dit
+        self._marks = deque(maxlen=window)
+        self._pauses = deque(maxlen=window)
+        self._interval = interval
+        self._pending = 0
+
+    @property
+    def wpm(self) -> float:
+        """
+        :return: The current speed as defined by 'words per minute'
+        """
+        return 1.2 / self.dit
+
+    def classify(self, duration: float, mark: bool) -> int:
+        """
+        Classifies the next signal of the stream.
+        :param duration: The duration of the signal in seconds
+        :param mark: Is the signal a mark (or a pause)?
+        :return: The label of the signal
+        """
+        units = duration / self.dit
+        if mark:
+            label = SHORT if units < 2 else LONG
+        elif units < 2:
+            label = PAUSE_SHORT
+        else:
+            label = PAUSE_MEDIUM if units < 5 else PAUSE_LONG
+
+        if self._marks.maxlen:
+            if mark:
+                self._marks.append(duration)
+                self._pending += 1
+            elif label != PAUSE_LONG:
+                # Word pauses are too irregular to tell anything about the speed
+                self._pauses.append(duration)
+
+            # The initial speed holds until enough marks are seen, a few marks at frame resolution mislead the estimate
+            if self._pending >= self._interval:
+                self._pending = 0
+                self.dit = TimingClassifier._estimate(np.array(self._marks), np.array(self._pauses)) or self.dit
+        return label
+
+
+class AdaptiveClassifier(TimingClassifier):
+    """
+    A timing classifier that follows changes of the speed within a recording instead of assuming a single speed.
+    """
+
+    def __init__(self, plot: bool = False, window: int = 32):
+        """
+        Configures the classifier.
+        :param plot: Should the classified signals be displayed?
+        :param window: Number of latest marks the speed is estimated from
+        """
+        super().__init__(plot)
+        self._window = window
+
+    def _predict(self, data: np.ndarray) -> tuple:
+        """
+        Assigns every data point in order to a signal by its loudness and its duration in DITs at the current speed.
+        :param data: An array of data points
+        :return: (labels, squared errors of the durations in log2 units) for every data point
+        """
+        tracker = SpeedTracker(self._dit or 0.1, self._window)
+        labels = np.empty(len(data), dtype=np.int64)
+        dits = np.empty(len(data))
+
+        for index, (duration, loudness) in enumerate(data.tolist()):
+            dits[index] = tracker.dit
+            labels[index] = tracker.classify(duration, loudness > self._threshold)
+
+        return labels, self._errors(data[:, 0] / dits, labels)
@@ -0,0 +1,164 @@
+import io
+import os
+import struct
+import wave
+
+import numpy as np
+
+from resampler import Resampler
+
+# Format tags of the fmt chunk
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Type of a sample by format tag and sample width, 24 bit samples are mapped as bytes and converted
+TYPES = {
+    (WAVE_FORMAT_PCM, 1): np.dtype('u1'),
+    (WAVE_FORMAT_PCM, 2): np.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 3): np.dtype('u1'),
+    (WAVE_FORMAT_PCM, 4): np.dtype('<i4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 4): np.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 8): np.dtype('<f8'),
+}
+
+
+class WaveFile:
+    """
+    A wave audio file whose samples are memory-mapped instead of being read into memory (or used in place if the
+    content of the file is given).
+    Integer samples of 8, 16, 24 and 32 bit as well as float samples are supported, with any number of channels.
+    """
+
+    def __init__(self, source):
+        """
+        Locates the format and data chunks of the given RIFF file and maps its samples.
+        :param source: The path to the file to read in, or the content of a file as bytes-like object
+        """
+        self.filename = source if isinstance(source, (str, os.PathLike)) else None
+        self.channels = 0
+        self.framerate = 0
+        self.sampwidth = 0
+        self.format = 0
+
+        if self.filename is None:
+            content = memoryview(source).cast('B')
+            offset, size = self._parse(io.BytesIO(content))
+            available = len(content)
+        else:
+            with open(source, 'rb') as file:
+                offset, size = self._parse(file)
+            available = os.path.getsize(source)
+
+        if (self.format, self.sampwidth) not in TYPES:
+            raise wave.Error('unsupported sample format: %d with a width of %d' % (self.format, self.sampwidth))
+        dtype = TYPES[(self.format, self.sampwidth)]
+
+        # Broken headers (e.g. of interrupted recordings) may declare more data than there is
+        size = max(min(size, available - offset), 0)
+        frames = size // (self.sampwidth * self.channels)
+
+        # One row per sample frame and one column per channel (and byte of a 24 bit sample)
+        shape = (frames, self.channels) if self.sampwidth != 3 else (frames, self.channels, 3)
+        if frames == 0:
+            self.data = np.empty(shape, dtype=dtype)
+        elif self.filename is None:
+            self.data = np.frombuffer(content, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        else:
+            self.data = np.memmap(source, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    def _parse(self, file) -> tuple:
+        """
+        Reads the chunk headers of the file up to the data chunk.
+        :param file: The file opened in binary mode
+        :return: (offset, size) of the data chunk in bytes
+        """
+        header = file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+            raise wave.Error('file does not start with RIFF id')
+
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise wave.Error('data chunk missing')
+            chunk, size = struct.unpack('<4sI', header)
+
+            if chunk == b'fmt ':
+                content = file.read(size + size % 2)
+                if len(content) < 16:
+                    raise wave.Error('fmt chunk too short')
+                self.format, self.channels, self.framerate, _, _, bits = struct.unpack('<HHIIHH', content[:16])
+                self.sampwidth = (bits + 7) // 8
+                if not self.channels or not self.framerate:
+                    raise wave.Error('fmt chunk without channels or sample rate')
+
+                # The actual format of an extensible file is given by the first bytes of its sub format GUID
+                if self.format == WAVE_FORMAT_EXTENSIBLE:
+                    if len(content) < 26:
+                        raise wave.Error('fmt chunk too short')
+                    self.format, = struct.unpack('<H', content[24:26])
+            elif chunk == b'data':
+                if not self.channels:
+                    raise wave.Error('fmt chunk missing')
+                return file.tell(), size
+            else:
+                # Chunks are padded to an even number of bytes
+                file.seek(size + size % 2, os.SEEK_CUR)
+
+    @property
+    def nframes(self) -> int:
+        """
+        :return: The number of sample frames (one sample per channel) within the file
+        """
+        return len(self.data)
+
+    @property
+    def samples(self) -> np.ndarray:
+        """
+        :return: The mono samples scaled to 16 bit, memory-mapped if the file already is 16 bit mono
+        """
+        if self.format == WAVE_FORMAT_PCM and self.sampwidth == 2 and self.channels == 1:
+            return self.data[:, 0]
+        return self.read(0, self.nframes)
+
+    def read(self, start: int, count: int) -> np.ndarray:
+        """
+        Converts a range of sample frames to mono samples scaled to 16 bit.
+        :param start: The first sample frame
+        :param count: The number of sample frames
+        :return: The samples as float array
+        """
+        data = self.data[start:start + count]
+
+        if self.sampwidth == 3:
+            # Sign-extend the little-endian bytes by placing them in the upper bytes of a 32 bit integer
+            data = np.ascontiguousarray(data)
+            padded = np.zeros(data.shape[:2] + (4,), dtype=np.uint8)
+            padded[..., 1:] = data
+            values = padded.view('<i4')[..., 0] / 65536.0
+        elif self.format == WAVE_FORMAT_IEEE_FLOAT:
+            values = data * 32768.0
+        elif self.sampwidth == 1:
+            values = (data.astype(np.float64) - 128) * 256
+        elif self.sampwidth == 4:
+            values = data / 65536.0
+        else:
+            values = data.astype(np.float64)
+
+        # Down-mix all channels
+        return values.mean(axis=1) if self.channels > 1 else values[:, 0]
+
+    def blocks(self, size: int = 1 << 16, rate: int = None):
+        """
+        Reads the file block by block as mono samples scaled to 16 bit, optionally resampled to another rate.
+        :param size: Number of sample frames that are read at once
+        :param rate: The sample rate of the returned samples, the rate of the file if not set
+        :return: A generator of sample arrays
+        """
+        resampler = None
+        if rate is not None and rate != self.framerate:
+            resampler = Resampler(self.framerate, rate)
+
+        for start in range(0, self.nframes, size):
+            block = self.read(start, size)
+            yield block if resampler is None else resampler.process(block)